@@ -0,0 +1,249 @@
+"""Cost of dispatching an update to the handlers through Telethon, with the
+old chain of one Telethon handler per pattern and with the routers.
+
+The handlers are no-ops with the patterns and the propagation of the ones in
+bot.py, so the difference is the dispatch cost per update.
+
+The baseline has one no-op handler per event type, it is the cost of
+building the events that both dispatchers pay.
+
+Usage: python3 benchmarks/dispatch.py [iterations]"""
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+from telethon.events import NewMessage, CallbackQuery, InlineQuery, \
+    StopPropagation
+from telethon.tl.types import UpdateNewMessage, UpdateBotCallbackQuery, \
+    UpdateBotInlineQuery, Message, PeerUser, User, InputPeerUser
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from metrics import METRICS  # noqa: E402
+from router import MessageRouter, CallbackRouter, InlineRouter  # noqa: E402
+
+
+ITERATIONS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+ROUNDS = 7
+USER_ID = 100
+ADMIN_ID = 1
+# (event, pattern, stops the propagation, admin only) in the order of bot.py
+HANDLERS = [
+    ("callback", rb"delete(_(?P<msg_1>\d+))?", True, False),
+    ("message", r"/start( lang_((es)|(en))_id_(?P<id>\d+))?", None, False),
+    ("message", "/help", True, False),
+    ("message", "/support", True, False),
+    ("message", r"/director (?P<director>.+)", True, False),
+    ("message", r"/cast (?P<cast>.+)", True, False),
+    ("message", r"(?P<title>[^/].*)", True, False),
+    ("callback", rb"film_(?P<id>\d+)", True, False),
+    ("message", r"/start lang_((es)|(en))_id_(?P<id>\d+)", True, False),
+    ("callback", rb"synopsis_(?P<id>\d+)", True, False),
+    ("callback", rb"awards_(?P<id>\d+)", True, False),
+    ("callback", rb"reviews_(?P<id>\d+)", True, False),
+    ("callback", rb"images_(?P<id>\d+)(_(?P<offset>\d+))?", True, False),
+    ("message", "/language", True, False),
+    ("callback", b"lang_(?P<lang>es|en)", True, False),
+    ("message", "/top", True, False),
+    ("callback", rb"top_(?P<service>\w+)", True, False),
+    ("message", "/ads", True, True),
+    ("message", r"/change_ad_(?P<index>[0-4]) (?P<new_ad>.+)", True, True),
+    ("message", "/session", True, True),
+    ("message", r"/broadcast (?P<lang>(es)|(en)|(all))", True, True),
+    ("message", r"/stats", True, True),
+]
+MESSAGES = (
+    "el padrino", "/start", "/start lang_es_id_809297", "/help", "/top",
+    "/cast tom hanks", "/stats", "amelie",
+)
+CALLBACKS = (
+    b"film_809297", b"synopsis_809297", b"reviews_809297", b"top_Netflix",
+    b"delete_12", b"images_809297",
+)
+INLINE_QUERIES = ("matrix", "interstellar")
+# names of the handlers run, to check both dispatchers run the same ones
+CALLS = []
+
+
+def make_handler(name: str, stops):
+    async def handler(event):
+        CALLS.append(name)
+        if stops is None:
+            # /start handler, the deep links continue to the movie handler
+            if not event.pattern_match["id"]:
+                raise StopPropagation
+        elif stops:
+            raise StopPropagation
+
+    handler.__name__ = name
+    return handler
+
+
+async def i18n_handler(event):
+    event.lang = "es"
+
+
+async def private_door(event):
+    if not event.is_private:
+        raise StopPropagation
+
+
+async def admin_handler(event):
+    if event.sender_id != ADMIN_ID:
+        raise StopPropagation
+
+
+def admin_filter(event) -> bool:
+    return event.sender_id == ADMIN_ID
+
+
+def make_client() -> TelegramClient:
+    client = TelegramClient(StringSession(), 1, "x")
+    client._self_input_peer = InputPeerUser(ADMIN_ID, 0)
+    client._entity_cache.add([User(id=USER_ID, access_hash=1)])
+    return client
+
+
+def chain_client() -> TelegramClient:
+    """
+    One Telethon handler per pattern, as bot.py did.
+    """
+    client = make_client()
+    on = client.add_event_handler
+
+    for event in (InlineQuery(), CallbackQuery(), NewMessage()):
+        on(METRICS.handler(i18n_handler), event)
+    on(METRICS.handler(make_handler("inline", True)), InlineQuery())
+    for event in (CallbackQuery(), NewMessage()):
+        on(METRICS.handler(private_door), event)
+
+    admin = False
+    for i, (kind, pattern, stops, admin_only) in enumerate(HANDLERS):
+        if admin_only and not admin:
+            on(METRICS.handler(admin_handler), NewMessage())
+            admin = True
+        handler = METRICS.handler(make_handler(f"handler_{i}", stops))
+        if kind == "message":
+            on(handler, NewMessage(pattern=pattern))
+        else:
+            on(handler, CallbackQuery(pattern=pattern))
+
+    return client
+
+
+def router_client() -> TelegramClient:
+    """
+    One Telethon handler per event type dispatching through the routers.
+    """
+    client = make_client()
+    messages = MessageRouter()
+    callbacks = CallbackRouter()
+    inline = InlineRouter()
+
+    for router in (messages, callbacks, inline):
+        router.hook(i18n_handler)
+    inline.route()(make_handler("inline", True))
+    for router in (messages, callbacks):
+        router.hook(private_door)
+
+    for i, (kind, pattern, stops, admin_only) in enumerate(HANDLERS):
+        router = messages if kind == "message" else callbacks
+        router.route(pattern, filter=admin_filter if admin_only else None)(
+            make_handler(f"handler_{i}", stops)
+        )
+
+    client.add_event_handler(messages.dispatch, NewMessage())
+    client.add_event_handler(callbacks.dispatch, CallbackQuery())
+    client.add_event_handler(inline.dispatch, InlineQuery())
+    return client
+
+
+def baseline_client() -> TelegramClient:
+    client = make_client()
+
+    async def noop(event):
+        pass
+
+    for event in (NewMessage(), CallbackQuery(), InlineQuery()):
+        client.add_event_handler(noop, event)
+
+    return client
+
+
+def updates():
+    user = User(id=USER_ID, access_hash=1)
+    result = []
+
+    for text in MESSAGES:
+        result.append(UpdateNewMessage(
+            message=Message(
+                id=1, peer_id=PeerUser(USER_ID), date=None, message=text
+            ),
+            pts=1,
+            pts_count=1
+        ))
+    for data in CALLBACKS:
+        result.append(UpdateBotCallbackQuery(
+            query_id=1, user_id=USER_ID, peer=PeerUser(USER_ID), msg_id=1,
+            chat_instance=1, data=data
+        ))
+    for query in INLINE_QUERIES:
+        result.append(UpdateBotInlineQuery(
+            query_id=1, user_id=USER_ID, query=query, offset=""
+        ))
+
+    for update in result:
+        # set by Telethon when the update is received
+        update._entities = {USER_ID: user}
+
+    return [(update, [user]) for update in result]
+
+
+async def handlers_run(client: TelegramClient):
+    result = []
+    for update, others in updates():
+        CALLS.clear()
+        await client._dispatch_update(update, others, None, None)
+        result.append(list(CALLS))
+
+    return result
+
+
+async def bench(client: TelegramClient) -> float:
+    batch = updates()
+    start = time.perf_counter()
+
+    for _ in range(ITERATIONS):
+        for update, others in batch:
+            await client._dispatch_update(update, others, None, None)
+
+    return (time.perf_counter() - start) / (ITERATIONS * len(batch))
+
+
+async def main():
+    chain, router = chain_client(), router_client()
+    assert await handlers_run(chain) == await handlers_run(router)
+
+    clients = {
+        "baseline": baseline_client(), "chain": chain, "router": router
+    }
+    results = {name: [] for name in clients}
+    for client in clients.values():
+        await bench(client)  # warm up
+
+    # interleaved rounds, the best of each is kept
+    for _ in range(ROUNDS):
+        for name, client in clients.items():
+            results[name].append(await bench(client))
+
+    baseline = min(results["baseline"])
+    for name, times in results.items():
+        print(
+            f"{name:>8}: {min(times) * 1e6:.1f} µs/update, "
+            f"{(min(times) - baseline) * 1e6:.1f} µs dispatching"
+        )
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
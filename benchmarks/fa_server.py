@@ -0,0 +1,109 @@
+"""Local stand-in for filmaffinity.com serving the pages recorded by
+record_fixtures.py, with optional latency and error rate."""
+import random
+import hashlib
+import asyncio
+from pathlib import Path
+from collections import defaultdict
+
+from aiohttp import web
+
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def load_fixtures() -> dict:
+    """
+    Returns {lang: {kind: [page content, ...]}} with the recorded pages.
+    """
+    fixtures = defaultdict(lambda: defaultdict(list))
+
+    for path in sorted(FIXTURES.glob("*/*.html")):
+        name = path.stem
+        if name.startswith("filmimages"):
+            kind = "images"
+        elif name.startswith("film"):
+            kind = "film"
+        else:
+            kind = name.split("-")[0]
+        fixtures[path.parent.name][kind].append(path.read_bytes())
+
+    if not fixtures:
+        raise SystemExit(
+            "No fixtures found, record them with: "
+            "python3 benchmarks/record_fixtures.py"
+        )
+
+    return fixtures
+
+
+def point_to(client, base_url: str):
+    """
+    Makes a FilmAffinity client request its pages to base_url.
+    """
+    client.url = f"{base_url}/{client.lang}/"
+    client.url_film = client.url + "film"
+    client.url_images = client.url + "filmimages.php?movie_id="
+
+
+class FAServer:
+    """
+    HTTP server answering the FilmAffinity URLs used by the bot with the
+    recorded pages. Movie ids are mapped to the recorded movies in a round
+    robin, so any id can be requested.
+    """
+
+    def __init__(self, latency: float = 0, error_rate: float = 0):
+        self.fixtures = load_fixtures()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.requests = 0
+        self.not_modified = 0
+        self.url = None
+        self._runner = None
+
+    def _page(self, lang: str, kind: str, key: int) -> bytes:
+        pages = self.fixtures[lang][kind] or self.fixtures["es"][kind]
+        return pages[key % len(pages)] if pages else b""
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(random.expovariate(1 / self.latency))
+        if random.random() < self.error_rate:
+            return web.Response(status=503)
+
+        lang, _, page = request.path.strip("/").partition("/")
+        if page.startswith("filmimages"):
+            body = self._page(lang, "images", int(request.query["movie_id"]))
+        elif page.startswith("film"):
+            body = self._page(lang, "film", int(page[4:].split(".")[0]))
+        elif page.startswith("topcat"):
+            body = self._page(lang, "topcat", hash(request.query["id"]))
+        else:
+            body = self._page(lang, "search", hash(request.query_string))
+
+        # the recorded pages never change
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if request.headers.get("If-None-Match") == etag:
+            self.not_modified += 1
+            return web.Response(status=304, headers={"ETag": etag})
+
+        return web.Response(
+            body=body, content_type="text/html", headers={"ETag": etag}
+        )
+
+    async def start(self, port: int = 0) -> str:
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+
+        return self.url
+
+    async def stop(self):
+        await self._runner.cleanup()
@@ -0,0 +1,73 @@
+"""Compares the throughput of movie fetches done with the sync client in the
+default executor against the async fetcher, both against a local stand-in
+for FilmAffinity serving the recorded pages.
+
+Usage: python3 benchmarks/fetch_throughput.py [movies] [latency_secs]"""
+import sys
+import time
+import asyncio
+import logging
+from pathlib import Path
+from functools import partial
+
+import requests
+from python_filmaffinity import FilmAffinity
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from fetch import Fetcher  # noqa: E402
+from fa_async import AsyncFilmAffinity  # noqa: E402
+from fa_server import FAServer, point_to  # noqa: E402
+
+
+MOVIES = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+LATENCY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+
+
+async def executor_path(base_url: str) -> float:
+    client = FilmAffinity(lang="es", cache_backend="memory")
+    point_to(client, base_url)
+    # plain session, the sync client would answer from its cache otherwise
+    client.session = requests.Session()
+    loop = asyncio.get_event_loop()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        loop.run_in_executor(None, partial(client.get_movie, id=str(mid)))
+        for mid in range(MOVIES)
+    ))
+
+    return MOVIES / (time.perf_counter() - start)
+
+
+async def async_path(base_url: str) -> float:
+    client = FilmAffinity(lang="es", cache_backend="memory")
+    point_to(client, base_url)
+    fetcher = Fetcher()
+    fa = AsyncFilmAffinity(client, fetcher)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(fa.get_movie(str(mid)) for mid in range(MOVIES)))
+    elapsed = time.perf_counter() - start
+    await fetcher.close()
+
+    return MOVIES / elapsed
+
+
+async def main():
+    # the sync client logs every request
+    logging.disable(logging.WARNING)
+    server = FAServer(latency=LATENCY)
+    base_url = await server.start()
+
+    executor = await executor_path(base_url)
+    native = await async_path(base_url)
+
+    await server.stop()
+
+    print(f"movies: {MOVIES}, server latency: {LATENCY}s")
+    print(f"executor path: {executor:8.1f} movies/sec")
+    print(f"async path:    {native:8.1f} movies/sec")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
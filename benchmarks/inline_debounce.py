@@ -0,0 +1,111 @@
+"""Simulates users typing inline queries key by key and counts how many
+searches reach FilmAffinity with and without the inline debouncer.
+
+Each user stops typing for a moment in the middle of the word, longer than
+the debounce delay, so a search starts and is cancelled by the next key.
+
+Usage: python3 benchmarks/inline_debounce.py [users]"""
+import sys
+import random
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from debounce import Debouncer, Superseded  # noqa: E402
+
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+WORDS = ("interstellar", "el padrino", "amelie", "matrix reloaded")
+DELAY = 0.4
+# seconds between keystrokes, of a pause and of an upstream search, a pause
+# ends before the search it started can finish
+KEY_DELAY = (0.08, 0.3)
+PAUSE = (0.5, 0.65)
+SEARCH_TIME = (0.3, 1.2)
+PAUSES = 1
+
+
+class Upstream:
+    """
+    Stand-in for FilmAffinity search, records the queries it receives.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    async def search(self, top: int, title: str):
+        self.queries.append(title)
+        await asyncio.sleep(random.uniform(*SEARCH_TIME))
+        return [title] * top
+
+
+def typing(tid: int):
+    """
+    Returns the word typed by the user and the seconds after each key, the
+    same in every simulation.
+    """
+    rng = random.Random(tid)
+    word = rng.choice(WORDS)
+    delays = [rng.uniform(*KEY_DELAY) for _ in word]
+    for i in rng.sample(range(len(word) - 1), PAUSES):
+        delays[i] = rng.uniform(*PAUSE)
+
+    return word, delays
+
+
+async def user(tid: int, upstream: Upstream, debouncer: Debouncer, answers: dict):
+    word, delays = typing(tid)
+    tasks = []
+
+    for i, delay in enumerate(delays, 1):
+        if debouncer is None:
+            coro = upstream.search(20, title=word[:i])
+        else:
+            coro = debouncer.run(tid, upstream.search, 20, title=word[:i])
+        tasks.append(asyncio.ensure_future(coro))
+        await asyncio.sleep(delay)
+
+    for task in tasks:
+        try:
+            answers[tid] = (await task)[0]
+        except Superseded:
+            pass
+
+    # the user must get the results for the full text
+    assert answers[tid] == word, (answers[tid], word)
+
+    return len(word)
+
+
+async def simulate(debouncer: Debouncer = None):
+    upstream = Upstream()
+    answers = {}
+    keystrokes = sum(await asyncio.gather(*(
+        user(tid, upstream, debouncer, answers) for tid in range(USERS)
+    )))
+
+    return keystrokes, len(upstream.queries)
+
+
+async def main():
+    random.seed(0)
+    keystrokes, plain = await simulate()
+
+    random.seed(0)
+    debouncer = Debouncer(delay=DELAY)
+    _, debounced = await simulate(debouncer)
+
+    print(f"users: {USERS}, inline queries: {keystrokes}")
+    print(f"upstream searches without debouncer: {plain}")
+    print(f"upstream searches with debouncer:    {debounced}")
+    print(f"debouncer: {debouncer.stats()}")
+
+    # a search per pause, cancelled by the next key, and one for the word
+    assert plain == keystrokes, plain
+    assert debounced == USERS * (PAUSES + 1), debounced
+    assert debouncer.cancelled == USERS * PAUSES, debouncer.stats()
+    assert debouncer.debounced == keystrokes - debounced, debouncer.stats()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
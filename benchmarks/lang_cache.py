@@ -0,0 +1,78 @@
+"""Compares the updates/sec of the language lookup done by i18n_handler with
+and without the in-memory language cache.
+
+Usage: python3 benchmarks/lang_cache.py [users] [updates]"""
+import sys
+import time
+import random
+import asyncio
+import tempfile
+from pathlib import Path
+
+import aiosqlite
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from caches import TTLCache  # noqa: E402
+
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+UPDATES = int(sys.argv[2]) if len(sys.argv) > 2 else 50_000
+
+
+async def lookup(db_conn: aiosqlite.Connection, tid: int, cache: TTLCache = None):
+    lang = cache.get(tid) if cache is not None else None
+
+    if lang is None:
+        async with db_conn.execute(
+            "SELECT lang FROM user WHERE tid = ?",
+            (tid, )
+        ) as cursor:
+            (lang, ) = (await cursor.fetchone()) or (None, )
+
+        if cache is not None:
+            cache.set(tid, lang)
+
+    return lang
+
+
+async def run(db_conn: aiosqlite.Connection, tids, cache: TTLCache = None) -> float:
+    start = time.perf_counter()
+    for tid in tids:
+        await lookup(db_conn, tid, cache)
+
+    return len(tids) / (time.perf_counter() - start)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_conn = await aiosqlite.connect(str(Path(tmp) / "bot-db.sqlite"))
+        await db_conn.execute(
+            """
+            CREATE TABLE user (
+                tid     INT64       PRIMARY KEY     NOT NULL,
+                lang    VARCHAR(2)  DEFAULT 'es'    NOT NULL
+            )
+            """
+        )
+        await db_conn.executemany(
+            "INSERT INTO user (tid, lang) VALUES (?, ?)",
+            ((tid, random.choice(("es", "en"))) for tid in range(USERS))
+        )
+        await db_conn.commit()
+
+        # updates follow a skewed distribution, a few users send most of them
+        tids = [int(random.paretovariate(1.2)) % USERS for _ in range(UPDATES)]
+
+        without_cache = await run(db_conn, tids)
+        cache = TTLCache(maxsize=100_000, ttl=24 * 60 * 60)
+        with_cache = await run(db_conn, tids, cache)
+
+        await db_conn.close()
+
+    print(f"users: {USERS}, updates: {UPDATES}")
+    print(f"without cache: {without_cache:10.0f} updates/sec")
+    print(f"with cache:    {with_cache:10.0f} updates/sec ({cache.stats()})")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
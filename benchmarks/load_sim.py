@@ -0,0 +1,427 @@
+"""End-to-end load simulator of the bot.
+
+Drives the real handlers of src/bot.py with fake Telethon events whose
+respond/answer/edit calls go to a stand-in for Telegram, against the local
+stand-in for filmaffinity.com of fa_server.py. Every simulated user replays
+sessions of: a search, opening a movie, tapping some of its sections, typing
+an inline query and opening a top.
+
+Runs a level of concurrent users after another and reports for each one the
+throughput, the latency percentiles of every action and the saturation of
+the executors and the event loop. Ends with the most users served with a p95
+latency under --p95 seconds.
+
+Usage:
+    python3 benchmarks/load_sim.py [--users 10,50,100] [--duration 30]
+        [--think 1] [--fa-latency 0.2] [--fa-errors 0]
+        [--telegram-latency 0.05] [--movies 5000]"""
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import itertools
+import tempfile
+import statistics
+from pathlib import Path
+from types import SimpleNamespace
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import aiosqlite
+from telethon.events import NewMessage, CallbackQuery, InlineQuery
+from telethon.tl.custom import InlineBuilder
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+from fa_server import FAServer, point_to  # noqa: E402
+
+
+WORDS = (
+    "matrix", "amelie", "el padrino", "interstellar", "alien", "casablanca",
+    "vertigo", "psicosis", "up", "coco", "her", "roma", "joker", "tiburón",
+)
+SECTIONS = ("synopsis", "awards", "reviews", "images")
+SERVICES = ("HBO", "Netflix", "Filmin", "Movistar", "Rakuten")
+# seconds between the keys typed in an inline query
+TYPING = 0.15
+
+
+class FakeTelegram:
+    """
+    Stand-in for the Telegram API, counts the calls of the handlers and
+    answers them after a random latency.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = Counter()
+        self._ids = itertools.count(1)
+
+    def _message(self) -> SimpleNamespace:
+        return SimpleNamespace(id=next(self._ids), photo=None)
+
+    async def call(self, method: str, file=None, **kwargs):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(random.expovariate(1 / self.latency))
+
+        if isinstance(file, list):
+            return [self._message() for _ in file]
+        return self._message()
+
+
+class FakeEvent:
+    """
+    Attributes and methods of the Telethon events used by the handlers,
+    mixed before the Telethon event classes so isinstance() still works.
+    """
+    is_private = True
+
+    def __init__(self, telegram: FakeTelegram, user: int):
+        # the Telethon events refuse new attributes after being initialized
+        self.__dict__["_init"] = False
+        self.telegram = telegram
+        self.user = user
+        self.pattern_match = None
+
+    @property
+    def sender_id(self) -> int:
+        return self.user
+
+    async def respond(self, *args, **kwargs):
+        return await self.telegram.call("respond", **kwargs)
+
+    async def answer(self, *args, **kwargs):
+        return await self.telegram.call("answer")
+
+    async def edit(self, *args, **kwargs):
+        return await self.telegram.call("edit")
+
+    async def delete(self, *args, **kwargs):
+        return await self.telegram.call("delete")
+
+
+class FakeMessage(FakeEvent, NewMessage.Event):
+    def __init__(self, telegram: FakeTelegram, user: int, text: str):
+        super().__init__(telegram, user)
+        self.message = SimpleNamespace(message=text)
+
+
+class FakeCallback(FakeEvent, CallbackQuery.Event):
+    def __init__(self, telegram: FakeTelegram, user: int, data: bytes):
+        super().__init__(telegram, user)
+        self._fake_data = data
+
+    @property
+    def data(self) -> bytes:
+        return self._fake_data
+
+    @property
+    def message_id(self) -> int:
+        return 1
+
+
+class FakeInline(FakeEvent, InlineQuery.Event):
+    def __init__(self, telegram: FakeTelegram, user: int, text: str, client):
+        super().__init__(telegram, user)
+        self._fake_text = text
+        self._fake_client = client
+
+    @property
+    def text(self) -> str:
+        return self._fake_text
+
+    @property
+    def builder(self) -> InlineBuilder:
+        return InlineBuilder(self._fake_client)
+
+
+class ErrorCounter(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.errors = 0
+
+    def emit(self, record):
+        self.errors += 1
+
+
+def import_bot(tmp: Path):
+    """
+    Imports bot.py in a scratch dir, so its session and DBs are not the ones
+    in data/.
+    """
+    (tmp / "data").mkdir()
+    (tmp / "files").symlink_to(ROOT / "files")
+    (tmp / "data/ads.json").write_text((ROOT / "data/ads.json").read_text())
+    for name, value in (
+        ("API_ID", "1"), ("API_HASH", "x"), ("BOT_TOKEN", "x"),
+        ("ADMIN_ID", "1"), ("METRICS_PORT", "0"),
+    ):
+        os.environ.setdefault(name, value)
+
+    os.chdir(tmp)
+    import bot
+    return bot
+
+
+async def setup(bot, fa_url: str):
+    """
+    The part of bot.main() that doesn't need Telegram.
+    """
+    loop = asyncio.get_event_loop()
+    bot.start_parsers()
+    loop.set_default_executor(bot.EXECUTOR)
+
+    bot.db_conn = await aiosqlite.connect(str(bot.DB))
+    await bot.db_conn.execute(
+        "CREATE TABLE user (tid INT64 PRIMARY KEY NOT NULL, "
+        "lang VARCHAR(2) DEFAULT 'es' NOT NULL)"
+    )
+    await bot.WRITER.setup(bot.db_conn)
+    await bot.MEDIA.setup(bot.db_conn)
+    await bot.USER_STATS.setup(bot.db_conn)
+    await bot.PAGE_CACHE.setup()
+    bot.WRITER.start()
+    bot.PAGE_CACHE.start()
+
+    for fa in (bot.fa_es, bot.fa_en):
+        point_to(fa.client, fa_url)
+
+
+async def teardown(bot):
+    await bot.TOPS.stop()
+    await bot.FETCHER.close()
+    await bot.WRITER.stop()
+    await bot.PAGE_CACHE.stop()
+    await bot.db_conn.close()
+    bot.PARSERS.shutdown()
+
+
+class Simulation:
+    """
+    A level of concurrent users replaying sessions for `duration` seconds.
+    """
+
+    def __init__(self, bot, args, telegram: FakeTelegram, first_user: int):
+        self.bot = bot
+        self.args = args
+        self.telegram = telegram
+        self.first_user = first_user
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        # movie ids with popularity decreasing as 1/rank
+        self.movies = [str(100_000 + i) for i in range(args.movies)]
+        self.weights = [1 / rank for rank in range(1, args.movies + 1)]
+
+    async def _timed(self, action: str, dispatch, event):
+        start = time.perf_counter()
+        await dispatch(event)
+        self.latencies[action].append(time.perf_counter() - start)
+
+    async def _think(self):
+        await asyncio.sleep(random.expovariate(1 / self.args.think))
+
+    async def _inline(self, user: int, query: str):
+        tasks = []
+        for i in range(1, len(query) + 1):
+            event = FakeInline(self.telegram, user, query[:i], self.bot.bot)
+            # the queries are sent while typing, without waiting the answers
+            tasks.append(asyncio.ensure_future(self._timed(
+                "inline", self.bot.INLINE_QUERIES.dispatch, event
+            )))
+            await asyncio.sleep(TYPING)
+
+        await asyncio.gather(*tasks)
+
+    async def session(self, user: int, deadline: float):
+        bot, telegram = self.bot, self.telegram
+
+        def message(text):
+            return FakeMessage(telegram, user, text)
+
+        def callback(data):
+            return FakeCallback(telegram, user, data)
+
+        while time.perf_counter() < deadline:
+            await self._timed(
+                "search", bot.MESSAGES.dispatch, message(random.choice(WORDS))
+            )
+            await self._think()
+
+            mid = random.choices(self.movies, self.weights)[0]
+            await self._timed(
+                "movie", bot.CALLBACKS.dispatch,
+                callback(f"film_{mid}".encode())
+            )
+            for section in random.sample(SECTIONS, random.randint(0, 3)):
+                await self._think()
+                await self._timed(
+                    section, bot.CALLBACKS.dispatch,
+                    callback(f"{section}_{mid}".encode())
+                )
+                if section == "images" and random.random() < 0.5:
+                    await self._think()
+                    await self._timed(
+                        "images page", bot.CALLBACKS.dispatch,
+                        callback(f"images_{mid}_10".encode())
+                    )
+
+            await self._think()
+            await self._inline(user, random.choice(WORDS))
+
+            await self._think()
+            await self._timed("top", bot.MESSAGES.dispatch, message("/top"))
+            await self._timed(
+                "select top", bot.CALLBACKS.dispatch,
+                callback(f"top_{random.choice(SERVICES)}".encode())
+            )
+            await self._think()
+
+    async def _sample(self, deadline: float):
+        bot = self.bot
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await asyncio.sleep(0.1)
+            self.samples["loop lag ms"].append(
+                (time.perf_counter() - start - 0.1) * 1000
+            )
+            self.samples["executor queue"].append(
+                bot.EXECUTOR._work_queue.qsize()
+            )
+            self.samples["executor threads"].append(len(bot.EXECUTOR._threads))
+            self.samples["parser pending"].append(
+                len(bot.PARSERS._pending_work_items)
+            )
+            self.samples["db pending writes"].append(bot.WRITER.pending)
+
+    async def run(self, users: int) -> float:
+        deadline = time.perf_counter() + self.args.duration
+        start = time.perf_counter()
+        await asyncio.gather(
+            self._sample(deadline),
+            *(
+                self.session(self.first_user + user, deadline)
+                for user in range(users)
+            )
+        )
+
+        return time.perf_counter() - start
+
+
+def percentile(values: List[float], q: float) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+
+    return statistics.quantiles(values, n=100)[int(q * 100) - 1]
+
+
+def report(users: int, elapsed: float, sim: Simulation, errors: int) -> float:
+    """
+    Prints the results of a level, returns its p95 latency.
+    """
+    every = [value for values in sim.latencies.values() for value in values]
+    p95 = percentile(every, 0.95)
+
+    print(
+        f"\n== {users} users: {len(every) / elapsed:.1f} actions/s, "
+        f"p95 {p95 * 1000:.0f} ms, {errors} errors"
+    )
+    print(f"{'action':<14}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for action, values in sorted(sim.latencies.items()):
+        print(
+            f"{action:<14}{len(values):>7}"
+            f"{percentile(values, 0.50) * 1000:>9.0f}"
+            f"{percentile(values, 0.95) * 1000:>9.0f}"
+            f"{percentile(values, 0.99) * 1000:>9.0f}"
+        )
+    for name, values in sim.samples.items():
+        print(
+            f"{name + ':':<20} mean {statistics.mean(values):8.1f}"
+            f"   max {max(values):8.1f}"
+        )
+
+    return p95
+
+
+async def main(args):
+    fa_server = FAServer(latency=args.fa_latency, error_rate=args.fa_errors)
+    fa_url = await fa_server.start()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = import_bot(Path(tmp))
+        # the logs of the bot are not sent to Telegram, only counted
+        root = logging.getLogger()
+        root.removeHandler(bot.LOGS_HANDLER)
+        root.setLevel(logging.WARNING)
+        error_counter = ErrorCounter()
+        root.addHandler(error_counter)
+
+        await setup(bot, fa_url)
+        telegram = FakeTelegram(args.telegram_latency)
+        served = 0
+        first_user = 1000
+
+        try:
+            for users in args.users:
+                errors = error_counter.errors
+                sim = Simulation(bot, args, telegram, first_user)
+                elapsed = await sim.run(users)
+                first_user += users
+
+                p95 = report(
+                    users, elapsed, sim, error_counter.errors - errors
+                )
+                if p95 <= args.p95:
+                    served = max(served, users)
+        finally:
+            await teardown(bot)
+            await fa_server.stop()
+
+        print(
+            f"\nTelegram calls: {dict(telegram.calls)}, "
+            f"FilmAffinity requests: {fa_server.requests}"
+        )
+        print(f"Most users with p95 <= {args.p95} s: {served or 'none'}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--users", default="10,50,100",
+        type=lambda value: [int(users) for users in value.split(",")],
+        help="levels of concurrent users (default 10,50,100)"
+    )
+    parser.add_argument(
+        "--duration", type=float, default=30, help="seconds of every level"
+    )
+    parser.add_argument(
+        "--think", type=float, default=1,
+        help="mean seconds of a user between actions"
+    )
+    parser.add_argument(
+        "--fa-latency", type=float, default=0.2,
+        help="mean latency of FilmAffinity in seconds"
+    )
+    parser.add_argument(
+        "--fa-errors", type=float, default=0,
+        help="rate of FilmAffinity requests answered with 503"
+    )
+    parser.add_argument(
+        "--telegram-latency", type=float, default=0.05,
+        help="mean latency of the Telegram calls in seconds"
+    )
+    parser.add_argument(
+        "--movies", type=int, default=5000, help="number of distinct movies"
+    )
+    parser.add_argument(
+        "--p95", type=float, default=1, help="p95 latency target in seconds"
+    )
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main(parse_args()))
@@ -0,0 +1,117 @@
+"""Load test of first-time users: each one looks up its language and is
+inserted, with a commit per user as i18n_handler did and with the
+write-behind DBWriter on a WAL DB.
+
+Usage: python3 benchmarks/new_users.py [users] [concurrency]"""
+import sys
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+
+import aiosqlite
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from db_writer import DBWriter  # noqa: E402
+
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+CONCURRENCY = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+
+async def create_db(path: str) -> aiosqlite.Connection:
+    db_conn = await aiosqlite.connect(path)
+    await db_conn.execute(
+        """
+        CREATE TABLE user (
+            tid     INT64       PRIMARY KEY     NOT NULL,
+            lang    VARCHAR(2)  DEFAULT 'es'    NOT NULL
+        )
+        """
+    )
+    await db_conn.commit()
+    return db_conn
+
+
+async def lookup(db_conn: aiosqlite.Connection, tid: int):
+    async with db_conn.execute(
+        "SELECT lang FROM user WHERE tid = ?", (tid, )
+    ) as cursor:
+        return await cursor.fetchone()
+
+
+async def commit_per_user(db_conn: aiosqlite.Connection, tid: int):
+    await lookup(db_conn, tid)
+    await db_conn.execute(
+        "INSERT INTO user (tid, lang) VALUES (?, ?)", (tid, "es")
+    )
+    await db_conn.commit()
+
+
+def write_behind(writer: DBWriter):
+    async def new_user(db_conn: aiosqlite.Connection, tid: int):
+        await lookup(db_conn, tid)
+        writer.write(
+            "INSERT OR IGNORE INTO user (tid, lang) VALUES (?, ?)", (tid, "es")
+        )
+
+    return new_user
+
+
+async def load(db_conn: aiosqlite.Connection, new_user) -> list:
+    latencies = []
+    queue = iter(range(USERS))
+
+    async def worker():
+        for tid in queue:
+            start = time.perf_counter()
+            await new_user(db_conn, tid)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[worker() for _ in range(CONCURRENCY)])
+    return sorted(latencies)
+
+
+def report(name: str, elapsed: float, latencies: list):
+    p50 = latencies[len(latencies) // 2] * 1000
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000
+    print(
+        f"{name:>15}: {USERS / elapsed:8.0f} users/s, "
+        f"p50 {p50:.2f} ms, p95 {p95:.2f} ms"
+    )
+
+
+async def count(db_conn: aiosqlite.Connection) -> int:
+    async with db_conn.execute("SELECT COUNT() FROM user") as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_conn = await create_db(str(Path(tmp) / "before.sqlite"))
+        try:
+            start = time.perf_counter()
+            latencies = await load(db_conn, commit_per_user)
+            report("commit per user", time.perf_counter() - start, latencies)
+            assert await count(db_conn) == USERS
+        finally:
+            await db_conn.close()
+
+        db_conn = await create_db(str(Path(tmp) / "after.sqlite"))
+        writer = DBWriter()
+        try:
+            await writer.setup(db_conn)
+            writer.start()
+            start = time.perf_counter()
+            latencies = await load(db_conn, write_behind(writer))
+            await writer.stop()
+            # including the final flush
+            report("write-behind", time.perf_counter() - start, latencies)
+            assert await count(db_conn) == USERS
+            print(f"{'':>15}  {writer.stats()}")
+        finally:
+            await db_conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,100 @@
+"""Stress test of the page cache: 32 concurrent readers, served by the writer
+connection and by 4 and 32 reader threads with a connection each, while
+pages are written, evicted and vacuumed at the same time. Reports the read latency
+and fails if any read or write errors.
+
+Usage: python3 benchmarks/page_cache_stress.py [seconds per run]"""
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+import statistics
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from page_cache import PageCache  # noqa: E402
+
+
+SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+CLIENTS = 32
+PAGES = 2_000
+WORDS = [os.urandom(4).hex() for _ in range(2_000)]
+
+
+def page(i: int) -> bytes:
+    """
+    Synthetic page of ~60 KB, compressible like the real ones.
+    """
+    rng = random.Random(i)
+    return " ".join(rng.choice(WORDS) for _ in range(6_500)).encode()
+
+
+def quantile(latencies, q: float) -> float:
+    return statistics.quantiles(latencies, n=100)[int(q * 100) - 1] * 1000
+
+
+async def run(path: str, readers: int) -> int:
+    cache = PageCache(
+        path, max_bytes=64 * 1024 * 1024, interval=1, readers=readers
+    )
+    await cache.setup()
+    cache.start()
+    stop = time.perf_counter() + SECONDS
+    latencies = []
+    writes = 0
+
+    async def reader():
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            await cache.get(f"url{random.randrange(PAGES)}")
+            latencies.append(time.perf_counter() - start)
+
+    async def writer():
+        nonlocal writes
+        # refreshes the pages, making the cache evict and vacuum
+        while time.perf_counter() < stop:
+            i = random.randrange(PAGES * 2)
+            await cache.set(f"url{i}", "movie", PAGES_CONTENT[i % 50])
+            writes += 1
+
+    await asyncio.gather(writer(), *(reader() for _ in range(CLIENTS)))
+    await cache.maintain()
+    await cache.stop()
+
+    name = f"{readers} reader threads" if readers else "writer connection"
+    print(
+        f"{name:<20}{len(latencies) / SECONDS:>9.0f} reads/s"
+        f"{writes / SECONDS:>7.0f} writes/s"
+        f"   p50 {quantile(latencies, 0.5):6.2f} ms"
+        f"   p99 {quantile(latencies, 0.99):6.2f} ms"
+        f"   errors {cache.errors}"
+    )
+
+    return cache.errors
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "page-cache.sqlite")
+        cache = PageCache(path, max_bytes=64 * 1024 * 1024, readers=0)
+        await cache.setup()
+        for i in range(PAGES):
+            await cache.set(f"url{i}", "movie", PAGES_CONTENT[i % 50])
+        print(f"{CLIENTS} clients, {cache.stats()}")
+        await cache.stop()
+
+        errors = 0
+        for readers in (0, 4, CLIENTS):
+            errors += await run(path, readers)
+
+    if errors:
+        print(f"FAIL: {errors} errors")
+        sys.exit(1)
+
+
+PAGES_CONTENT = [page(i) for i in range(50)]
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -0,0 +1,60 @@
+"""Throughput of concurrent get_movie calls parsing the pages in the
+default thread pool and in process pools of 1, 2, 4 and 8 workers, against
+a local stand-in for FilmAffinity serving the recorded pages.
+
+Usage: python3 benchmarks/parse_pool.py [movies]"""
+import os
+import sys
+import time
+import asyncio
+from pathlib import Path
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from python_filmaffinity import FilmAffinity
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from fetch import Fetcher  # noqa: E402
+from fa_async import AsyncFilmAffinity  # noqa: E402
+from fa_server import FAServer, point_to  # noqa: E402
+
+
+MOVIES = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+WORKERS = (1, 2, 4, 8)
+
+
+async def throughput(base_url: str, executor: Executor = None) -> float:
+    client = FilmAffinity(lang="es", cache_backend="memory")
+    point_to(client, base_url)
+    fetcher = Fetcher()
+    fa = AsyncFilmAffinity(client, fetcher, executor)
+
+    # warm up, starts the workers
+    await fa.get_movie("0")
+
+    start = time.perf_counter()
+    movies = await asyncio.gather(
+        *(fa.get_movie(str(mid)) for mid in range(MOVIES))
+    )
+    elapsed = time.perf_counter() - start
+    await fetcher.close()
+    assert all(movies)
+
+    return MOVIES / elapsed
+
+
+async def main():
+    server = FAServer()
+    base_url = await server.start()
+
+    print(f"movies: {MOVIES}, cores: {os.cpu_count()}")
+    print(f"thread pool:       {await throughput(base_url):8.1f} movies/sec")
+    for workers in WORKERS:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            result = await throughput(base_url, executor)
+        print(f"{workers} process workers: {result:8.1f} movies/sec")
+
+    await server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
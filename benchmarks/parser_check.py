@@ -0,0 +1,85 @@
+"""Compares the data parsed by the lxml parsers of fa_parser with the data of
+the python_filmaffinity parsers on the pages recorded in benchmarks/fixtures
+by record_fixtures.py. Exits with 1 if any page differs.
+
+Usage: python3 benchmarks/parser_check.py"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+import fa_async  # noqa: E402
+import fa_parser  # noqa: E402
+
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+def parsers(page: Path):
+    """
+    Returns the current and the lxml parsers of the page, with their
+    arguments, from the name of the page.
+    """
+    lang, name = page.parent.name, page.stem
+
+    if name.startswith("filmimages"):
+        return "parse_images", (page.read_bytes(), )
+    if name.startswith("film"):
+        return "parse_movie", (lang, page.read_bytes(), name[len("film"):])
+    if name.startswith("search-"):
+        return "parse_search", (lang, page.read_bytes(), 20)
+    if name.startswith("topcat-"):
+        return "parse_top_service", (lang, page.read_bytes(), 40)
+
+    return None, ()
+
+
+def diff(expected, actual, path: str = ""):
+    """
+    Yields the paths where the parsed data differ.
+    """
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key in expected.keys() | actual.keys():
+            yield from diff(expected.get(key), actual.get(key), f"{path}.{key}")
+    elif isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            yield f"{path}: {len(expected)} items != {len(actual)} items"
+        for i, (e, a) in enumerate(zip(expected, actual)):
+            yield from diff(e, a, f"{path}[{i}]")
+    elif expected != actual or type(expected) != type(actual):
+        yield f"{path}: {expected!r} != {actual!r}"
+
+
+def main() -> int:
+    pages = sorted(FIXTURES.glob("*/*.html"))
+    if not pages:
+        print(f"No pages in {FIXTURES}, record them with record_fixtures.py")
+        return 1
+
+    failed = 0
+    for page in pages:
+        parser, args = parsers(page)
+        if parser is None:
+            continue
+
+        expected = getattr(fa_async, parser)(*args)
+        actual = getattr(fa_parser, parser)(*args)
+        # the dicts must have the same keys in the same order too
+        differences = list(diff(expected, actual))
+        if repr(expected) != repr(actual) and not differences:
+            differences = ["different order of the keys"]
+
+        name = page.relative_to(FIXTURES)
+        if differences:
+            failed += 1
+            print(f"FAIL {name}")
+            for difference in differences:
+                print(f"    {difference}")
+        else:
+            print(f"ok   {name}")
+
+    print(f"{len(pages) - failed}/{len(pages)} pages parsed the same")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
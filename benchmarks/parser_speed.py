@@ -0,0 +1,53 @@
+"""Pages per second parsed by the python_filmaffinity parsers and by the lxml
+parsers of fa_parser, on the pages recorded in benchmarks/fixtures.
+
+Usage: python3 benchmarks/parser_speed.py [seconds per parser]"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+import fa_async  # noqa: E402
+import fa_parser  # noqa: E402
+from parser_check import FIXTURES, parsers  # noqa: E402
+
+
+SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+
+def pages_per_second(module, parser: str, pages) -> float:
+    func = getattr(module, parser)
+    parsed = 0
+    start = time.perf_counter()
+
+    while time.perf_counter() - start < SECONDS:
+        for args in pages:
+            func(*args)
+        parsed += len(pages)
+
+    return parsed / (time.perf_counter() - start)
+
+
+def main():
+    by_parser = {}
+    for page in sorted(FIXTURES.glob("*/*.html")):
+        parser, args = parsers(page)
+        if parser is not None:
+            by_parser.setdefault(parser, []).append(args)
+
+    if not by_parser:
+        print(f"No pages in {FIXTURES}, record them with record_fixtures.py")
+        return
+
+    print(f"{'parser':<20}{'pages':>6}{'bs4/s':>10}{'lxml/s':>10}{'speedup':>9}")
+    for parser, pages in sorted(by_parser.items()):
+        bs4 = pages_per_second(fa_async, parser, pages)
+        lxml = pages_per_second(fa_parser, parser, pages)
+        print(
+            f"{parser:<20}{len(pages):>6}{bs4:>10.1f}{lxml:>10.1f}"
+            f"{lxml / bs4:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
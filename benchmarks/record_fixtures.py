@@ -0,0 +1,58 @@
+"""Records FilmAffinity pages used by the benchmarks in benchmarks/fixtures.
+
+Needs network access, pages are saved as <lang>/<name>.html:
+- film<id>.html: movie details.
+- filmimages<id>.html: images of the movie.
+- search-<title>.html: results of a search by title.
+- topcat-<category>.html: top of a service.
+
+Usage: python3 benchmarks/record_fixtures.py"""
+import sys
+import asyncio
+from pathlib import Path
+from urllib.parse import quote
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from fetch import Fetcher  # noqa: E402
+from fa_async import TOP_SERVICES  # noqa: E402
+
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+BASE_URL = "https://www.filmaffinity.com/"
+LANGS = ("es", "en")
+MOVIES = ("809297", "670216", "730528", "161026", "695552", "536488")
+TITLES = ("interstellar", "matrix", "el padrino", "amelie")
+
+
+async def main():
+    fetcher = Fetcher(limit_per_host=4)
+    pages = {}
+
+    for lang in LANGS:
+        url = BASE_URL + lang + "/"
+        for mid in MOVIES:
+            pages[f"{lang}/film{mid}.html"] = url + f"film{mid}.html"
+            pages[f"{lang}/filmimages{mid}.html"] = (
+                url + f"filmimages.php?movie_id={mid}"
+            )
+        for title in TITLES:
+            pages[f"{lang}/search-{title.replace(' ', '-')}.html"] = (
+                url + f"search.php?stype=title&stext={quote(title)}"
+            )
+        for category in TOP_SERVICES.values():
+            pages[f"{lang}/topcat-{category}.html"] = (
+                url + f"topcat.php?id={category}"
+            )
+
+    contents = await asyncio.gather(*(fetcher.get(url) for url in pages.values()))
+    await fetcher.close()
+
+    for name, content in zip(pages, contents):
+        path = FIXTURES / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+        print(f"Saved {name} ({len(content)} bytes)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,303 @@
+"""Offline microbenchmarks of the hot paths of the bot, on the pages in
+benchmarks/fixtures and fake Telethon events:
+
+- parsing of the search results, movies and tops, with both parsers.
+- humanize and the rendering of movie_template.
+- the search result and movie keyboards.
+- the text of the tops.
+- the routing of messages and callbacks, with the route patterns of bot.py.
+
+Prints a JSON with the time per operation of every case, with stable keys,
+so the results of two commits can be compared with --compare.
+
+Usage:
+    python3 benchmarks/suite.py [-o results.json] [--compare baseline.json]
+        [--threshold 0.10] [--cases pattern]"""
+import os
+import re
+import sys
+import json
+import asyncio
+import logging
+import hashlib
+import argparse
+import platform
+import statistics
+import timeit
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+import fa_async  # noqa: E402
+import fa_parser  # noqa: E402
+import keyboards as kbs  # noqa: E402
+from render import render_movie  # noqa: E402
+from router import MessageRouter, CallbackRouter  # noqa: E402
+from telethon.events import StopPropagation  # noqa: E402
+from tops import render_top  # noqa: E402
+from utils import humanize  # noqa: E402
+from parser_check import FIXTURES, parsers  # noqa: E402
+from load_sim import import_bot  # noqa: E402
+
+
+TRANSLATIONS = json.loads((ROOT / "files/i18n_messages.json").read_text())
+REPEAT = 5
+# minimum seconds of each repetition
+MIN_TIME = 0.2
+MESSAGES = ("el padrino", "/start", "/help", "/top", "/cast tom hanks")
+CALLBACKS = (b"film_809297", b"synopsis_809297", b"top_Netflix", b"delete_1")
+
+
+def i18n(lang: str) -> Callable[[str], str]:
+    """
+    The translation function the bot sets in event.i18n.
+    """
+    return lambda key: TRANSLATIONS[key][lang]
+
+
+def load_pages() -> Dict[str, list]:
+    """
+    Returns parser name -> arguments of the parser for every page.
+    """
+    pages = {}
+    for page in sorted(FIXTURES.glob("*/*.html")):
+        parser, args = parsers(page)
+        if parser is not None:
+            pages.setdefault(parser, []).append(args)
+
+    return pages
+
+
+def fixtures_digest() -> str:
+    digest = hashlib.sha1()
+    for page in sorted(FIXTURES.glob("*/*.html")):
+        digest.update(page.name.encode())
+        digest.update(page.read_bytes())
+
+    return digest.hexdigest()[:12]
+
+
+def over(func: Callable, items: list) -> Callable[[], None]:
+    """
+    Case running func over all the items, timed per item.
+    """
+    def case():
+        for item in items:
+            func(*item)
+
+    case.items = len(items)
+    return case
+
+
+def bot_routes() -> Tuple[List[str], List[bytes]]:
+    """
+    Returns the patterns of the message and callback routes of bot.py, in
+    registration order, importing it in a scratch dir as load_sim.py does.
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            bot = import_bot(Path(tmp))
+        finally:
+            os.chdir(cwd)
+        logging.getLogger().removeHandler(bot.LOGS_HANDLER)
+        bot.bot.session.close()
+
+    return tuple(
+        [route.pattern.pattern for routes in router.routes.values()
+         for route in routes]
+        for router in (bot.MESSAGES, bot.CALLBACKS)
+    )
+
+
+def routing_cases() -> Dict[str, Callable[[], None]]:
+    async def handler(event):
+        raise StopPropagation
+
+    message_routes, callback_routes = bot_routes()
+    messages, callbacks = MessageRouter(), CallbackRouter()
+    for pattern in message_routes:
+        messages.route(pattern)(handler)
+    for pattern in callback_routes:
+        callbacks.route(pattern)(handler)
+
+    # fake Telethon events, with the attributes read by the routers
+    message_events = [
+        SimpleNamespace(message=SimpleNamespace(message=text))
+        for text in MESSAGES
+    ]
+    callback_events = [SimpleNamespace(data=data) for data in CALLBACKS]
+    loop = asyncio.new_event_loop()
+
+    def dispatch(router, events):
+        async def run():
+            for event in events:
+                await router.dispatch(event)
+
+        def case():
+            loop.run_until_complete(run())
+
+        case.items = len(events)
+        return case
+
+    return {
+        "route_message": dispatch(messages, message_events),
+        "route_callback": dispatch(callbacks, callback_events),
+    }
+
+
+def cases() -> Dict[str, Callable[[], None]]:
+    pages = load_pages()
+    all_cases = {}
+
+    for name, module in (("bs4", fa_async), ("lxml", fa_parser)):
+        for parser in ("parse_search", "parse_movie", "parse_top_service"):
+            if pages.get(parser):
+                all_cases[f"{parser}[{name}]"] = over(
+                    getattr(module, parser), pages[parser]
+                )
+
+    movies = [
+        movie for movie in (
+            fa_parser.parse_movie(*args) for args in pages.get("parse_movie", [])
+        ) if movie
+    ]
+    results = [
+        fa_parser.parse_search(*args) for args in pages.get("parse_search", [])
+    ]
+    tops = [
+        fa_parser.parse_top_service(*args)
+        for args in pages.get("parse_top_service", [])
+    ]
+
+    if movies:
+        all_cases["humanize"] = over(humanize, [(movie, ) for movie in movies])
+        for lang in ("es", "en"):
+            all_cases[f"movie_template[{lang}]"] = over(
+                render_movie, [(i18n(lang), lang, movie) for movie in movies]
+            )
+        all_cases["kbs.movie_keyboard"] = over(
+            kbs.movie_keyboard,
+            [(i18n("es"), str(movie["id"]), [1, 2]) for movie in movies]
+        )
+    if results:
+        all_cases["kbs.search_result"] = over(
+            kbs.search_result, [(i18n("es"), result) for result in results]
+        )
+    if tops:
+        all_cases["render_top"] = over(
+            render_top, [("Netflix", result) for result in tops]
+        )
+
+    all_cases.update(routing_cases())
+    return all_cases
+
+
+def measure(case: Callable[[], None]) -> Dict[str, float]:
+    timer = timeit.Timer(case)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * MIN_TIME / elapsed)) if elapsed else number
+    # seconds per item of every repetition
+    times = [
+        t / number / case.items
+        for t in timer.repeat(repeat=REPEAT, number=number)
+    ]
+
+    return {
+        "min_us": round(min(times) * 1e6, 3),
+        "median_us": round(statistics.median(times) * 1e6, 3),
+        "ops_per_sec": round(1 / min(times), 1),
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> int:
+    """
+    Prints the change of every case to stderr, returns the number of
+    regressions.
+    """
+    if baseline["meta"]["fixtures"] != current["meta"]["fixtures"]:
+        print(
+            "warning: the results were measured on different fixtures",
+            file=sys.stderr
+        )
+
+    regressions = 0
+    print(
+        f"{'case':<28}{'before us':>12}{'after us':>12}{'change':>9}",
+        file=sys.stderr
+    )
+    for case, result in current["results"].items():
+        before = baseline["results"].get(case)
+        if before is None:
+            print(
+                f"{case:<28}{'-':>12}{result['min_us']:>12.3f}{'new':>9}",
+                file=sys.stderr
+            )
+            continue
+
+        change = result["min_us"] / before["min_us"] - 1
+        mark = ""
+        if change > threshold:
+            regressions += 1
+            mark = "  REGRESSION"
+        print(
+            f"{case:<28}{before['min_us']:>12.3f}{result['min_us']:>12.3f}"
+            f"{change:>+9.1%}{mark}",
+            file=sys.stderr
+        )
+
+    return regressions
+
+
+def main() -> int:
+    # the parsers log the fields missing in the sample pages
+    logging.disable(logging.WARNING)
+
+    args = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    args.add_argument("-o", "--output", help="file to write the JSON to")
+    args.add_argument("--compare", help="JSON of a previous run")
+    args.add_argument(
+        "--threshold", type=float, default=0.10,
+        help="slowdown of a case reported as regression (default 0.10)"
+    )
+    args.add_argument("--cases", help="regex of the cases to run")
+    args = args.parse_args()
+
+    all_cases = cases()
+    if args.cases:
+        all_cases = {
+            name: case for name, case in all_cases.items()
+            if re.search(args.cases, name)
+        }
+
+    results = {}
+    for name in sorted(all_cases):
+        results[name] = measure(all_cases[name])
+        print(f"{name:<28}{results[name]['min_us']:>12.3f} us", file=sys.stderr)
+
+    current = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "fixtures": fixtures_digest(),
+        },
+        "results": results,
+    }
+    output = json.dumps(current, indent=2, sort_keys=True)
+    if args.output:
+        Path(args.output).write_text(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        return 1 if compare(baseline, current, args.threshold) else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Time of the /stats user counts with COUNT() scans and with the counters
+maintained by triggers, on a DB of synthetic users.
+
+Usage: python3 benchmarks/user_stats.py [users]"""
+import sys
+import time
+import random
+import asyncio
+import sqlite3
+import tempfile
+from pathlib import Path
+
+import aiosqlite
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+from user_stats import UserStats  # noqa: E402
+
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+ROUNDS = 20
+
+
+def create_db(path: str):
+    db_conn = sqlite3.connect(path)
+    with db_conn:
+        db_conn.execute(
+            """
+            CREATE TABLE user (
+                tid     INT64       PRIMARY KEY     NOT NULL,
+                lang    VARCHAR(2)  DEFAULT 'es'    NOT NULL
+            )
+            """
+        )
+        db_conn.executemany(
+            "INSERT INTO user (tid, lang) VALUES (?, ?)",
+            ((tid, random.choice(("es", "es", "en"))) for tid in range(USERS))
+        )
+    db_conn.close()
+
+
+async def scans(db_conn: aiosqlite.Connection):
+    """
+    The queries of /stats before the counters.
+    """
+    result = []
+    for query in (
+        "SELECT COUNT() FROM user",
+        "SELECT COUNT() FROM user WHERE lang = 'es'",
+        "SELECT COUNT() FROM user WHERE lang = 'en'",
+    ):
+        async with db_conn.execute(query) as cursor:
+            result.append((await cursor.fetchone())[0])
+
+    return result
+
+
+async def timed(func) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        result = await func()
+
+    return (time.perf_counter() - start) / ROUNDS * 1000, result
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "bot-db.sqlite")
+        create_db(path)
+        db_conn = await aiosqlite.connect(path)
+
+        try:
+            elapsed, (total, es, en) = await timed(lambda: scans(db_conn))
+            print(f"{USERS} users, COUNT() scans: {elapsed:.2f} ms")
+
+            stats = UserStats()
+            start = time.perf_counter()
+            await stats.setup(db_conn)
+            print(f"migration: {time.perf_counter() - start:.2f} s")
+
+            elapsed, _ = await timed(lambda: scans(db_conn))
+            print(f"COUNT() scans with the lang index: {elapsed:.2f} ms")
+
+            elapsed, counts = await timed(stats.counts)
+            print(f"counters: {elapsed:.3f} ms")
+            assert counts == {"es": es, "en": en}, counts
+            assert sum(counts.values()) == total
+
+            # the triggers keep the counters right
+            await db_conn.execute(
+                "INSERT INTO user (tid, lang) VALUES (?, 'en')", (USERS, )
+            )
+            await db_conn.execute("UPDATE user SET lang = 'en' WHERE tid = 0")
+            await db_conn.commit()
+            counts = await stats.counts()
+            assert await scans(db_conn) == [
+                sum(counts.values()), counts["es"], counts["en"]
+            ]
+        finally:
+            await db_conn.close()
+
+
+if __name__ == "__main__":
+    asyncio.get_event_loop().run_until_complete(main())
@@ -20,6 +20,7 @@ if not DB.is_file():
             )
             """
         )
+        db_conn.execute("CREATE INDEX user_lang ON user (lang)")
     print("Created table 'user'.")
 
     if SESSION_DB.is_file():
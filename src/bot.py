@@ -4,7 +4,8 @@ import logging
 import asyncio
 import urllib3
 import json
-from functools import partial
+import re
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -15,15 +16,30 @@ from telethon.events import NewMessage, CallbackQuery, StopPropagation, \
     InlineQuery
 from telethon.tl.types import InputWebDocument
 from telethon.errors.rpcerrorlist import MediaCaptionTooLongError, \
-    WebpageMediaEmptyError, UserIsBlockedError, UserIsBotError, \
-    PeerIdInvalidError, ChannelPrivateError, ChatWriteForbiddenError, \
-    ChatAdminRequiredError, InputUserDeactivatedError
+    WebpageMediaEmptyError
 from python_filmaffinity import FilmAffinity
 from python_filmaffinity.exceptions import FilmAffinityConnectionError
 
 import keyboards as kbs
 from bot_types import MessageEvent, CallbackMessageEventLike
 from utils import humanize, TelegramLogsHandler, get_random_ad
+from caches import TTLCache
+from repository import MovieRepository, SearchRepository, StillRepository
+from render import RenderCache
+from fetch import Fetcher
+from fa_async import AsyncFilmAffinity, init_parser_process
+from debounce import Debouncer, Superseded
+from tops import TopLists
+from broadcast import Broadcaster
+from media import MediaCache
+from user_stats import UserStats
+from db_writer import DBWriter
+from page_cache import PageCache
+from prefetch import Prefetcher
+from scheduler import UpstreamScheduler, current_priority, current_user
+from snapshot import Snapshot
+from metrics import METRICS
+from router import MessageRouter, CallbackRouter, InlineRouter
 
 
 dotenv.load_dotenv()
@@ -34,61 +50,196 @@ BOT_TOKEN = os.environ["BOT_TOKEN"]
 ADMIN_ID = int(os.environ["ADMIN_ID"])
 SESSION = Path("data/faffinity-bot.session")
 DB = Path("data/bot-db.sqlite")
+PAGE_CACHE_DB = Path("data/page-cache.sqlite")
+# requests cache of python_filmaffinity, replaced by the page cache
+OLD_PAGE_CACHE_DB = Path("data/cache-film-affinity.sqlite")
+SNAPSHOT_FILE = Path("data/snapshot.json.gz")
 NO_IMAGE = "https://www.filmaffinity.com/imgs/movies/noimgfull.jpg"
 TRANSLATIONS = json.load(open("files/i18n_messages.json"))
 ADS_FILE = Path("data/ads.json")
 with ADS_FILE.open(encoding="utf8") as ads_file:
     ADS = json.load(ads_file)
+SEARCH_CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", 60 * 60))
+SEARCH_CACHE_MB = int(os.environ.get("SEARCH_CACHE_MB", 32))
+TOP_REFRESH_INTERVAL = int(os.environ.get("TOP_REFRESH_INTERVAL", 6 * 60 * 60))
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9464))
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", os.cpu_count() or 1))
+FA_PARSER = os.environ.get("FA_PARSER", "lxml")
+PAGE_CACHE_MB = int(os.environ.get("PAGE_CACHE_MB", 512))
+PAGE_CACHE_EVICTION = os.environ.get("PAGE_CACHE_EVICTION", "lru")
+PAGE_CACHE_READERS = int(os.environ.get("PAGE_CACHE_READERS", 4))
+PREFETCH_TOP = int(os.environ.get("PREFETCH_TOP", 0))
+PREFETCH_BUDGET = int(os.environ.get("PREFETCH_BUDGET", 8))
+UPSTREAM_LIMIT = int(os.environ.get("UPSTREAM_LIMIT", 16))
+SNAPSHOT_INTERVAL = int(os.environ.get("SNAPSHOT_INTERVAL", 15 * 60))
+# images sent at once, the max of a Telegram album
+GALLERY_PAGE = 10
+START_LANG = re.compile(r"/start lang_(?P<lang>(es)|(en))")
 START_TIME = datetime.now()
 MOVIES_SEEN = 0
+# requests to FilmAffinity in the first minute up, set once it is over
+FIRST_MINUTE_REQUESTS: int | None = None
 
 bot = TelegramClient(str(SESSION), API_ID, API_HASH)
+LOGS_HANDLER = TelegramLogsHandler(bot, ADMIN_ID)
 
 logging.basicConfig(
     format="[%(levelname)s/%(asctime)s] %(name)s: %(message)s",
     level=logging.INFO,
     handlers=[
         logging.StreamHandler(),
-        TelegramLogsHandler(bot, ADMIN_ID)
+        LOGS_HANDLER
     ]
 )
 
 urllib3.disable_warnings()
 
-# Spanish FA client
-fa_es = FilmAffinity(lang="es", cache_path="data")
+# pool of connections to FilmAffinity shared by both clients
+FETCHER = Fetcher()
+# default executor of the loop
+EXECUTOR = ThreadPoolExecutor(thread_name_prefix="bot-executor")
+# processes parsing the FilmAffinity pages, the parsing holds the GIL
+PARSERS = ProcessPoolExecutor(
+    max_workers=PARSE_WORKERS, initializer=init_parser_process
+)
+# requests to FilmAffinity of both clients, by priority and user
+UPSTREAM = UpstreamScheduler(limit=UPSTREAM_LIMIT)
+# compressed FilmAffinity pages of both clients, kept between restarts
+PAGE_CACHE = PageCache(
+    str(PAGE_CACHE_DB),
+    max_bytes=PAGE_CACHE_MB * 1024 * 1024,
+    eviction=PAGE_CACHE_EVICTION,
+    readers=PAGE_CACHE_READERS
+)
+# Spanish FA client, the pages are downloaded by the fetcher so the client
+# only needs the in-memory cache of python_filmaffinity
+fa_es = AsyncFilmAffinity(
+    FilmAffinity(lang="es", cache_backend="memory"),
+    FETCHER, PARSERS, FA_PARSER, PAGE_CACHE, UPSTREAM
+)
 # English FA client
-fa_en = FilmAffinity(lang="en", cache_path="data")
+fa_en = AsyncFilmAffinity(
+    FilmAffinity(lang="en", cache_backend="memory"),
+    FETCHER, PARSERS, FA_PARSER, PAGE_CACHE, UPSTREAM
+)
 db_conn: aiosqlite.Connection | None = None
+# batches the writes of the users in periodic commits
+WRITER = DBWriter()
+# tid -> lang of the users, avoids a DB query for every incoming update
+LANG_CACHE = TTLCache(maxsize=100_000, ttl=24 * 60 * 60)
+# (lang, id) -> movie details shared by the movie handlers
+MOVIES = MovieRepository(
+    TTLCache(maxsize=2_000, ttl=6 * 60 * 60), UPSTREAM
+)
+# (lang, id, section) -> rendered messages of the movies
+RENDERED = RenderCache(TTLCache(maxsize=8_000, ttl=6 * 60 * 60))
+MOVIES.on_refresh.append(RENDERED.invalidate)
+# (lang, id) -> stills of the movies for the galleries
+STILLS = StillRepository(
+    TTLCache(maxsize=2_000, ttl=6 * 60 * 60), UPSTREAM
+)
+# (lang, field, normalized query, top) -> results of the searches
+SEARCHES = SearchRepository(
+    TTLCache(
+        maxsize=20_000,
+        ttl=SEARCH_CACHE_TTL,
+        max_bytes=SEARCH_CACHE_MB * 1024 * 1024
+    ),
+    UPSTREAM
+)
+# only the latest inline query of each user reaches FilmAffinity
+INLINE_SEARCHES = Debouncer(delay=0.4)
+
+PREFETCHER = Prefetcher(
+    MOVIES,
+    top=PREFETCH_TOP,
+    budget=PREFETCH_BUDGET,
+    # the parsers, the threads of the bot or FilmAffinity are behind the
+    # users
+    overloaded=lambda: (
+        len(PARSERS._pending_work_items) > 2 * PARSE_WORKERS or
+        EXECUTOR._work_queue.qsize() > 0 or
+        UPSTREAM.queued > 0
+    )
+)
+# rendered tops of the services, refreshed in background
+TOPS = TopLists([fa_es, fa_en], interval=TOP_REFRESH_INTERVAL)
+BROADCASTS = Broadcaster(bot)
+# image URL -> photo uploaded to Telegram
+MEDIA = MediaCache(WRITER)
+# hottest data of the caches, kept between restarts
+SNAPSHOT = Snapshot(
+    SNAPSHOT_FILE,
+    movies=MOVIES.cache,
+    searches=SEARCHES.cache,
+    langs=LANG_CACHE,
+    tops=TOPS,
+    interval=SNAPSHOT_INTERVAL
+)
+# users by language, maintained by the DB
+USER_STATS = UserStats()
+# one handler per event type, routing the events to the handlers below
+MESSAGES = MessageRouter()
+CALLBACKS = CallbackRouter()
+INLINE_QUERIES = InlineRouter()
+bot.add_event_handler(MESSAGES.dispatch, NewMessage())
+bot.add_event_handler(CALLBACKS.dispatch, CallbackQuery())
+bot.add_event_handler(INLINE_QUERIES.dispatch, InlineQuery())
+
+METRICS.gauge("executor_queue_depth", lambda: EXECUTOR._work_queue.qsize())
+METRICS.gauge("executor_threads", lambda: len(EXECUTOR._threads))
+METRICS.gauge("parser_pending", lambda: len(PARSERS._pending_work_items))
+METRICS.gauge("db_pending_writes", lambda: WRITER.pending)
+METRICS.gauge("movies_cache_hit_ratio", lambda: MOVIES.cache.hit_ratio)
+METRICS.gauge("searches_cache_hit_ratio", lambda: SEARCHES.cache.hit_ratio)
+METRICS.gauge("page_cache_hit_ratio", lambda: PAGE_CACHE.hit_ratio)
+METRICS.gauge("page_cache_bytes", lambda: PAGE_CACHE.size)
+METRICS.gauge("prefetch_hit_ratio", lambda: PREFETCHER.hit_ratio)
+METRICS.gauge("fa_circuit_open", lambda: int(FETCHER.breaker.is_open))
+METRICS.gauge("upstream_running", lambda: UPSTREAM.running)
+METRICS.gauge("snapshot_load_seconds", lambda: SNAPSHOT.load_seconds or 0)
+METRICS.gauge(
+    "first_minute_fa_requests",
+    lambda: (
+        FETCHER.requests if FIRST_MINUTE_REQUESTS is None
+        else FIRST_MINUTE_REQUESTS
+    )
+)
+METRICS.gauge("upstream_queue_depth", lambda: UPSTREAM.queued)
+METRICS.gauge("upstream_oldest_wait_seconds", lambda: UPSTREAM.oldest_wait)
 
 
-@bot.on(NewMessage(pattern=r"/start lang_(?P<lang>(es)|(en))"))
-@bot.on(NewMessage())
-@bot.on(CallbackQuery())
-@bot.on(InlineQuery())
+@MESSAGES.hook
+@CALLBACKS.hook
+@INLINE_QUERIES.hook
 async def i18n_handler(event: CallbackMessageEventLike):
     """
     Sets the default language for this event.
     """
-    if isinstance(event, NewMessage.Event) and event.pattern_match is not None:
-        print(event.pattern_match, type(event))
-        event_lang = event.pattern_match.groupdict().get("lang")
+    if isinstance(event, NewMessage.Event):
+        match = START_LANG.match(event.message.message or "")
+        event_lang = match["lang"] if match else None
     else:
         event_lang = None
 
-    async with db_conn.execute(
-        "SELECT lang FROM user WHERE tid = ?",
-        (event.sender_id, )
-    ) as cursor:
-        (lang, ) = (await cursor.fetchone()) or (None, )
+    lang = LANG_CACHE.get(event.sender_id)
 
     if lang is None:
-        lang = event_lang or "es"
-        await db_conn.execute(
-            "INSERT INTO user (tid, lang) VALUES (?, ?)",
-            (event.sender_id, lang, )
-        )
-        await db_conn.commit()
+        async with db_conn.execute(
+            "SELECT lang FROM user WHERE tid = ?",
+            (event.sender_id, )
+        ) as cursor:
+            (lang, ) = (await cursor.fetchone()) or (None, )
+
+        if lang is None:
+            lang = event_lang or "es"
+            WRITER.write(
+                "INSERT OR IGNORE INTO user (tid, lang) VALUES (?, ?)",
+                (event.sender_id, lang, )
+            )
+
+        LANG_CACHE.set(event.sender_id, lang)
 
     event.lang = lang
     event.i18n = lambda key: TRANSLATIONS[key][lang]
@@ -98,19 +249,41 @@ async def i18n_handler(event: CallbackMessageEventLike):
         event.fa_client = fa_en
 
 
-@bot.on(InlineQuery())
+@MESSAGES.hook
+@CALLBACKS.hook
+@INLINE_QUERIES.hook
+async def priority_handler(event: CallbackMessageEventLike):
+    """
+    Sets the priority of the FilmAffinity requests of this event, the
+    buttons tapped go before the searches and these before the inline
+    queries.
+    """
+    if isinstance(event, CallbackQuery.Event):
+        current_priority.set("tap")
+    elif isinstance(event, InlineQuery.Event):
+        current_priority.set("inline")
+    else:
+        current_priority.set("search")
+    current_user.set(event.sender_id)
+
+
+@INLINE_QUERIES.route()
 async def inline_search_handler(event: InlineQuery.Event):
     _ = event.i18n
     fa = event.fa_client
     builder = event.builder
 
     try:
-        result = await bot.loop.run_in_executor(
-            None, partial(fa.search, 20, title=event.text)
-        )
+        # includes the debounce delay
+        with METRICS.stage("fa"):
+            result = await INLINE_SEARCHES.run(
+                event.sender_id, SEARCHES.search, fa, 20, title=event.text
+            )
+    except Superseded:
+        return
     except FilmAffinityConnectionError as e:
         await event.answer([
-            builder.article(
+            await builder.article(
                 title=_("fa_error"),
                 text=_("fa_error")
             )
@@ -118,32 +291,36 @@ async def inline_search_handler(event: InlineQuery.Event):
         logging.error(e)
     else:
         if result:
-            await event.answer([
-                builder.article(
-                    title=movie["title"],
-                    text=_("inline_result").format(**humanize(movie)),
-                    thumb=InputWebDocument(
-                        url=movie["poster"],
-                        size=1,
-                        mime_type="image/jpg",
-                        attributes=[]
-                    ) if movie["poster"] != "/imgs/movies/noimgfull.jpg" else None,
-                    link_preview=False,
-                    buttons=kbs.inline_details(_, fa.lang, movie["id"])
-                )
-                for movie in result
-            ])
+            with METRICS.stage("render"):
+                articles = await asyncio.gather(*[
+                    builder.article(
+                        title=movie["title"],
+                        text=_("inline_result").format(**humanize(movie)),
+                        thumb=InputWebDocument(
+                            url=movie["poster"],
+                            size=1,
+                            mime_type="image/jpg",
+                            attributes=[]
+                        ) if movie["poster"] != "/imgs/movies/noimgfull.jpg" else None,
+                        link_preview=False,
+                        buttons=kbs.inline_details(_, fa.lang, movie["id"])
+                    )
+                    for movie in result
+                ])
+
+            with METRICS.stage("send"):
+                await event.answer(articles)
         else:
             await event.answer([
-                builder.article(
+                await builder.article(
                     title=_("no_matches").format(query=event.text),
                     text=_("no_matches").format(query=event.text),
                 )
             ])
 
 
-@bot.on(NewMessage())
-@bot.on(CallbackQuery())
+@MESSAGES.hook
+@CALLBACKS.hook
 async def private_door(event: MessageEvent | CallbackQuery.Event):
     """
     Avoids handling of events in groups and channels for next handlers.
@@ -152,7 +329,7 @@ async def private_door(event: MessageEvent | CallbackQuery.Event):
         raise StopPropagation
 
 
-@bot.on(CallbackQuery(pattern=rb"delete(_(?P<msg_1>\d+))?"))
+@CALLBACKS.route(rb"delete(_(?P<msg_1>\d+))?")
 async def delete_handler(event: CallbackQuery.Event):
     """
     Deletes the message of the button clicked and max 2 messages more.
@@ -171,7 +348,7 @@ async def delete_handler(event: CallbackQuery.Event):
     raise StopPropagation
 
 
-@bot.on(NewMessage(pattern=r"/start( lang_((es)|(en))_id_(?P<id>\d+))?"))
+@MESSAGES.route(r"/start( lang_((es)|(en))_id_(?P<id>\d+))?")
 async def start_handler(event: MessageEvent):
     """
     /start command handler.
@@ -185,7 +362,7 @@ async def start_handler(event: MessageEvent):
         raise StopPropagation
 
 
-@bot.on(NewMessage(pattern="/help"))
+@MESSAGES.route("/help")
 async def help_handler(event: MessageEvent):
     """
     /help command handler.
@@ -208,7 +385,7 @@ async def help_handler(event: MessageEvent):
     raise StopPropagation
 
 
-@bot.on(NewMessage(pattern="/support"))
+@MESSAGES.route("/support")
 async def support_handler(event: MessageEvent):
     """
     /support command handler.
@@ -224,9 +401,9 @@ async def support_handler(event: MessageEvent):
     raise StopPropagation
 
 
-@bot.on(NewMessage(pattern=r"(?P<title>[^/].*)"))
-@bot.on(NewMessage(pattern=r"/cast (?P<cast>.+)"))
-@bot.on(NewMessage(pattern=r"/director (?P<director>.+)"))
+@MESSAGES.route(r"(?P<title>[^/].*)")
+@MESSAGES.route(r"/cast (?P<cast>.+)")
+@MESSAGES.route(r"/director (?P<director>.+)")
 async def search_handler(event: MessageEvent):
     """
     Handles queries by title, cast and director.
@@ -236,18 +413,19 @@ async def search_handler(event: MessageEvent):
     query = event.pattern_match.groupdict()
 
     try:
-        result = await bot.loop.run_in_executor(
-            None, partial(fa.search, 20, **query)
-        )
+        with METRICS.stage("fa"):
+            result = await SEARCHES.search(fa, 20, **query)
     except FilmAffinityConnectionError as e:
         await event.respond(_("fa_error"))
         logging.error(e)
     else:
         if result:
-            await event.respond(
-                message=_("query_results"),
-                buttons=kbs.search_result(_, result)
-            )
+            with METRICS.stage("send"):
+                await event.respond(
+                    message=_("query_results"),
+                    buttons=kbs.search_result(_, result)
+                )
+            PREFETCHER.schedule(fa, result)
         else:
             await event.respond(
                 message=_("no_matches").format(
@@ -263,8 +441,8 @@ async def search_handler(event: MessageEvent):
     raise StopPropagation
 
 
-@bot.on(NewMessage(pattern=r"/start lang_((es)|(en))_id_(?P<id>\d+)"))
-@bot.on(CallbackQuery(pattern=rb"film_(?P<id>\d+)"))
+@MESSAGES.route(r"/start lang_((es)|(en))_id_(?P<id>\d+)")
+@CALLBACKS.route(rb"film_(?P<id>\d+)")
 async def movie_handler(event: CallbackMessageEventLike):
     """
     Shows the details about an specific movie.
@@ -280,193 +458,190 @@ async def movie_handler(event: CallbackMessageEventLike):
     mid = event.pattern_match["id"]
     if isinstance(mid, bytes):
         mid = mid.decode("utf8")
+    PREFETCHER.claim(fa.lang, mid)
 
     try:
-        movie = await bot.loop.run_in_executor(
-            None, partial(fa.get_movie, **{"id": mid})
-        )
+        with METRICS.stage("fa"):
+            movie = await MOVIES.get(fa, mid)
     except FilmAffinityConnectionError as e:
         await event.respond(_("fa_error"))
         logging.error(e)
     else:
         poster = movie["poster"] or NO_IMAGE
-        humanize(movie)
-        message = _("movie_template").format(**movie) + get_random_ad(_, ADS)
-
-        try:
-            await event.respond(
-                message=message,
-                file=poster,
-                buttons=kbs.movie_keyboard(_, movie["id"]),
-                link_preview=False
-            )
-        except MediaCaptionTooLongError:
-            poster_msg = await event.respond(
-                file=poster
-            )
-            await event.respond(
-                message=message,
-                buttons=kbs.movie_keyboard(
-                    _,
-                    mid=movie["id"],
-                    linked_msg_ids=[poster_msg.id]
-                ),
-                link_preview=False
+        with METRICS.stage("render"):
+            message = (
+                RENDERED.get(_, fa.lang, movie, "movie") +
+                get_random_ad(_, ADS)
             )
 
+        with METRICS.stage("send"):
+            try:
+                await MEDIA.respond(
+                    event,
+                    message=message,
+                    file=poster,
+                    buttons=kbs.movie_keyboard(_, movie["id"]),
+                    link_preview=False
+                )
+            except MediaCaptionTooLongError:
+                poster_msg = await MEDIA.respond(
+                    event,
+                    file=poster
+                )
+                await event.respond(
+                    message=message,
+                    buttons=kbs.movie_keyboard(
+                        _,
+                        mid=movie["id"],
+                        linked_msg_ids=[poster_msg.id]
+                    ),
+                    link_preview=False
+                )
+
     raise StopPropagation
 
 
-@bot.on(CallbackQuery(pattern=rb"synopsis_(?P<id>\d+)"))
+@CALLBACKS.route(rb"synopsis_(?P<id>\d+)")
 async def synopsis_handler(event: CallbackQuery.Event):
     _ = event.i18n
     fa = event.fa_client
     mid = event.pattern_match["id"].decode("utf8")
 
     try:
-        movie = await bot.loop.run_in_executor(
-            None, partial(fa.get_movie, **{"id": mid})
-        )
+        with METRICS.stage("fa"):
+            movie = await MOVIES.get(fa, mid)
     except FilmAffinityConnectionError as e:
         await event.respond(_("fa_error"))
         logging.error(e)
     else:
-        await event.respond(
-            message=(
-                f"ℹ **{_('Synopsis')}: "
-                "{title}** ℹ\n\n{description}".format(**movie) +
+        with METRICS.stage("render"):
+            message = (
+                RENDERED.get(_, fa.lang, movie, "synopsis") +
                 get_random_ad(_, ADS)
-            ),
-            buttons=kbs.hide(_),
-            link_preview=False
-        )
+            )
+
+        with METRICS.stage("send"):
+            await event.respond(
+                message=message,
+                buttons=kbs.hide(_),
+                link_preview=False
+            )
 
     raise StopPropagation
 
 
-@bot.on(CallbackQuery(pattern=rb"awards_(?P<id>\d+)"))
+@CALLBACKS.route(rb"awards_(?P<id>\d+)")
 async def awards_handler(event: CallbackQuery.Event):
-    lang = event.lang
     _ = event.i18n
     fa = event.fa_client
     mid = event.pattern_match["id"].decode("utf8")
 
     try:
-        movie = await bot.loop.run_in_executor(
-            None, partial(fa.get_movie, **{"id": mid})
-        )
+        with METRICS.stage("fa"):
+            movie = await MOVIES.get(fa, mid)
     except FilmAffinityConnectionError as e:
         await event.respond(_("fa_error"))
         logging.error(e)
     else:
-        awards = movie["awards"]
-        if awards:
-            awards_text = f"🏆 **{_('Awards')}: {movie['title']}** 🏆\n\n"
-            final = ""
-
-            for a in awards:
-                if a["year"].isalnum():
-                    awards_text += f"🔸 `{a['year']}`: {a['award']}\n"
-                else:
-                    final = f"↗ {a['year']}"
-
-            awards_text += (
-                f"\n[{final if final else _('see_at_fa')}]"
-                f"(https://www.filmaffinity.com/{lang}/film{movie['id']}.html)"
-            )
+        if movie["awards"]:
+            with METRICS.stage("render"):
+                message = (
+                    RENDERED.get(_, fa.lang, movie, "awards") +
+                    get_random_ad(_, ADS)
+                )
 
-            await event.respond(
-                message=awards_text + get_random_ad(_, ADS),
-                buttons=kbs.hide(_),
-                link_preview=False
-            )
+            with METRICS.stage("send"):
+                await event.respond(
+                    message=message,
+                    buttons=kbs.hide(_),
+                    link_preview=False
+                )
         else:
             await event.respond(_("no_awards"))
 
     raise StopPropagation
 
 
-@bot.on(CallbackQuery(pattern=rb"reviews_(?P<id>\d+)"))
+@CALLBACKS.route(rb"reviews_(?P<id>\d+)")
 async def reviews_handler(event: CallbackQuery.Event):
-    lang = event.lang
     _ = event.i18n
     fa = event.fa_client
     mid = event.pattern_match["id"].decode("utf8")
 
     try:
-        movie = await bot.loop.run_in_executor(
-            None, partial(fa.get_movie, **{"id": mid})
-        )
+        with METRICS.stage("fa"):
+            movie = await MOVIES.get(fa, mid)
     except FilmAffinityConnectionError as e:
         await event.respond(_("fa_error"))
         logging.error(e)
     else:
-        reviews = movie["reviews"]
-        if reviews:
-            reviews_text = (
-                f"💭 **{_('Reviews')}: {movie['title']}** 💭\n"
-            )
-
-            for r in reviews:
-                # remove `[` and `]` for don't break telegram markdown
-                actual_review = r["review"].replace("[", "")
-                actual_review = actual_review.replace("]", "")
-                reviews_text += (
-                    f"\n👤 [{r['author']}]"
-                    f"({r['url'] or f'www.filmaffinity.com/{lang}/film{mid}.html'})\n"
-                    f"💭 __{actual_review}__\n"
+        if movie["reviews"]:
+            with METRICS.stage("render"):
+                message = (
+                    RENDERED.get(_, fa.lang, movie, "reviews") +
+                    get_random_ad(_, ADS)
                 )
 
-            reviews_text += (
-                f"\n[{_('see_at_fa')}]"
-                f"(www.filmaffinity.com/{lang}/pro-reviews.php?movie-id={mid})"
-            )
-
-            await event.respond(
-                message=reviews_text + get_random_ad(_, ADS),
-                buttons=kbs.hide(_),
-                link_preview=False
-            )
+            with METRICS.stage("send"):
+                await event.respond(
+                    message=message,
+                    buttons=kbs.hide(_),
+                    link_preview=False
+                )
         else:
             await event.respond(_("no_reviews"))
 
     raise StopPropagation
 
 
-@bot.on(CallbackQuery(pattern=rb"images_(?P<id>\d+)"))
+@CALLBACKS.route(rb"images_(?P<id>\d+)(_(?P<offset>\d+))?")
 async def images_handler(event: CallbackQuery.Event):
     """
-    Sends images of a movie. Sends as max 10 images.
+    Sends a page of the stills of a movie, as max 10 images, with a button
+    for the next page.
     """
     _ = event.i18n
     fa = event.fa_client
     mid = event.pattern_match["id"].decode("utf8")
+    offset = int(event.pattern_match["offset"] or 0)
 
     try:
-        movie = await bot.loop.run_in_executor(
-            None, partial(fa.get_movie, **{"id": mid, "images": True})
-        )
+        with METRICS.stage("fa"):
+            stills = await STILLS.get(fa, mid)
     except FilmAffinityConnectionError as e:
         await event.respond(_("fa_error"))
         logging.error(e)
     else:
-        images = [
-            still["image"] for still in movie["images"]["stills"]
-            if still["image"]
-        ]
+        images = stills[offset:offset + GALLERY_PAGE]
         if images:
             try:
-                await event.respond(file=images[:10])
+                with METRICS.stage("send"):
+                    await MEDIA.respond(event, file=images)
             except WebpageMediaEmptyError as e:
                 await event.respond(_("no_images"))
                 logging.error(e)
+            else:
+                # the button of the previous page is replaced by the next one
+                if offset:
+                    await event.delete()
+
+                next_offset = offset + len(images)
+                if next_offset < len(stills):
+                    await event.respond(
+                        message=_("images_page").format(
+                            first=offset + 1,
+                            last=next_offset,
+                            total=len(stills)
+                        ),
+                        buttons=kbs.gallery(_, mid, next_offset)
+                    )
         else:
             await event.respond(_("no_images"))
 
     raise StopPropagation
 
 
-@bot.on(NewMessage(pattern="/language"))
+@MESSAGES.route("/language")
 async def language_handler(event: MessageEvent):
     """
     Sends a keyboard for language configuration.
@@ -479,18 +654,18 @@ async def language_handler(event: MessageEvent):
     raise StopPropagation
 
 
-@bot.on(CallbackQuery(pattern=b"lang_(?P<lang>es|en)"))
+@CALLBACKS.route(b"lang_(?P<lang>es|en)")
 async def select_language_handler(event: MessageEvent):
     """
     Handles the language selection by the user.
     """
     lang = event.pattern_match["lang"].decode("utf8")
 
-    await db_conn.execute(
+    WRITER.write(
         "UPDATE user SET lang = ? WHERE tid = ?",
         (lang, event.sender_id, )
     )
-    await db_conn.commit()
+    LANG_CACHE.set(event.sender_id, lang)
 
     await event.edit(
         text=TRANSLATIONS["lang_selected"][lang]
@@ -499,7 +674,7 @@ async def select_language_handler(event: MessageEvent):
     raise StopPropagation
 
 
-@bot.on(NewMessage(pattern="/top"))
+@MESSAGES.route("/top")
 async def top_handler(event: MessageEvent):
     """
     /top command handler.
@@ -514,60 +689,41 @@ async def top_handler(event: MessageEvent):
     raise StopPropagation
 
 
-@bot.on(CallbackQuery(pattern=rb"top_(?P<service>\w+)"))
-async def select_language_handler(event: MessageEvent):
+@CALLBACKS.route(rb"top_(?P<service>\w+)")
+async def select_top_handler(event: MessageEvent):
     """
     Handles the top selection by the user.
     """
     _ = event.i18n
-    fa: FilmAffinity = event.fa_client
+    fa: AsyncFilmAffinity = event.fa_client
     service = event.pattern_match["service"].decode("utf8")
 
-    top_services = {
-        "HBO": fa.top_hbo,
-        "Netflix": fa.top_netflix,
-        "Filmin": fa.top_filmin,
-        "Movistar": fa.top_movistar,
-        "Rakuten": fa.top_rakuten,
-    }
-
     try:
-        result = await bot.loop.run_in_executor(
-            None, partial(top_services[service], 40)
-        )
+        with METRICS.stage("fa"):
+            text = await TOPS.get(fa, service)
     except FilmAffinityConnectionError as e:
         await event.respond(_("fa_error"))
         logging.error(e)
     else:
-        text = f"🔝 Top {service} 🔝\n\n" + "\n\n".join(
-            [
-                "`%2d.` " % i + (
-                    "[{title}](https://t.me/faffinitybot?start=id_{id})\n"
-                    "📅 {year}      ⭐ {rating}/10"
-                ).format(**movie)
-                for movie, i in zip(result, range(1, 50))
-            ]
-        )
-        await event.respond(
-            message=text,
-            buttons=kbs.hide(_),
-            link_preview=False
-        )
+        with METRICS.stage("send"):
+            await event.respond(
+                message=text,
+                buttons=kbs.hide(_),
+                link_preview=False
+            )
 
     raise StopPropagation
 
 
 # #################### admin handlers ####################
-@bot.on(NewMessage())
-async def admin_handler(event: MessageEvent):
+def admin_filter(event: MessageEvent) -> bool:
     """
-    Raises StopPropagation if event's user is not the admin.
+    Only the events of the admin are handled by the admin handlers.
     """
-    if event.sender_id != ADMIN_ID:
-        raise StopPropagation
+    return event.sender_id == ADMIN_ID
 
 
-@bot.on(NewMessage(pattern="/ads"))
+@MESSAGES.route("/ads", filter=admin_filter)
 async def list_ads_handler(event: MessageEvent):
     """
     Lists the ads saved in files/ads.json.
@@ -581,7 +737,9 @@ async def list_ads_handler(event: MessageEvent):
     raise StopPropagation
 
 
-@bot.on(NewMessage(pattern=r"/change_ad_(?P<index>[0-4]) (?P<new_ad>.+)"))
+@MESSAGES.route(
+    r"/change_ad_(?P<index>[0-4]) (?P<new_ad>.+)", filter=admin_filter
+)
 async def change_ad_handler(event: MessageEvent):
     """
     Changes and saves in files/ads.json an specific ad.
@@ -602,7 +760,7 @@ async def change_ad_handler(event: MessageEvent):
     raise StopPropagation
 
 
-@bot.on(NewMessage(pattern="/session"))
+@MESSAGES.route("/session", filter=admin_filter)
 async def session_handler(event: MessageEvent):
     """
     /session command handler.
@@ -617,7 +775,9 @@ async def session_handler(event: MessageEvent):
     raise StopPropagation
 
 
-@bot.on(NewMessage(pattern=r"/broadcast (?P<lang>(es)|(en)|(all))"))
+@MESSAGES.route(
+    r"/broadcast (?P<lang>(es)|(en)|(all))", filter=admin_filter
+)
 async def broadcast_handler(event: MessageEvent):
     """
     /broadcast command handler.
@@ -626,100 +786,31 @@ async def broadcast_handler(event: MessageEvent):
 
     if msg:
         lang = event.pattern_match["lang"]
-        if lang == "all":
-            users_query = db_conn.execute("SELECT tid FROM user")
-            total_query = db_conn.execute("SELECT COUNT() FROM user")
-        else:
-            users_query = db_conn.execute(
-                "SELECT tid FROM user WHERE lang = ?",
-                (lang, )
-            )
-            total_query = db_conn.execute(
-                "SELECT COUNT() FROM user WHERE lang = ?",
-                (lang, )
-            )
-
-        async with total_query as cursor:
-            (total, ) = await cursor.fetchone()
-
-        text = (
-            '📢 Broadcasting to `{}` users...\n'
-            '🚫 Errors: `{}`\n'
-            '✅ Broadcast: `{}/{}`'
-        )
-        count = 0
-        errors = 0
         progress_msg = await event.respond(
-            message=text.format(lang, errors, count - errors, total)
-        )
-        step = (total + 50) // 50
-        async with users_query as cursor:
-            async for (tid, ) in cursor:
-                count += 1
-
-                try:
-                    await bot.send_message(
-                        entity=tid,
-                        message=msg
-                    )
-                except (
-                    ValueError,
-                    UserIsBlockedError,
-                    UserIsBotError,
-                    PeerIdInvalidError,
-                    ChannelPrivateError,
-                    ChatWriteForbiddenError,
-                    ChatAdminRequiredError,
-                    InputUserDeactivatedError
-                ):
-                    errors += 1
-                except Exception as e:
-                    errors += 1
-                    await event.respond(
-                        message=(
-                            f"Exception: `{type(e)}: {e}`\n\n"
-                            f"At user `{count}`. Sleeping `30` seconds..."
-                        )
-                    )
-                    await asyncio.sleep(30)
-
-                await asyncio.sleep(0.25)
-
-                if count % step == 0 or count == total:
-                    await progress_msg.edit(
-                        text=text.format(lang, errors, count - errors, total)
-                    )
-
-        await event.respond(
-            message="✅ Done!!!",
-            reply_to=progress_msg
+            message=f"📢 Preparing broadcast to `{lang}` users..."
         )
+        broadcast_id = await BROADCASTS.create(lang, msg, progress_msg)
+        BROADCASTS.start(broadcast_id)
     else:
         await event.respond("⚠ You must reply to a message with /broadcast command.")
 
     raise StopPropagation
 
 
-@bot.on(NewMessage(pattern=r"/stats"))
+@MESSAGES.route(r"/stats", filter=admin_filter)
 async def stats_handler(event: MessageEvent):
     """
     /stats command handler.
     """
-    async with db_conn.execute("SELECT COUNT() FROM user") as cursor:
-        (total_count, ) = await cursor.fetchone()
-
-    async with db_conn.execute("SELECT COUNT() FROM user WHERE lang = 'es'") as cursor:
-        (es_count, ) = await cursor.fetchone()
-
-    async with db_conn.execute("SELECT COUNT() FROM user WHERE lang = 'en'") as cursor:
-        (en_count, ) = await cursor.fetchone()
+    counts = await USER_STATS.counts()
+    total_count = sum(counts.values())
+    es_count = counts.get("es", 0)
+    en_count = counts.get("en", 0)
 
     uptime = str(datetime.now() - START_TIME).split(".")[0]
-
-    if (cache := Path("data/cache-film-affinity.sqlite")).exists():
-        cache_size = round(cache.stat().st_size / 1024 / 1024, 2)
-    else:
-        cache_size = 0
+    first_minute = (
+        "-" if FIRST_MINUTE_REQUESTS is None else FIRST_MINUTE_REQUESTS
+    )
 
     await event.respond(
         message=(
@@ -728,24 +819,99 @@ async def stats_handler(event: MessageEvent):
             f"🇪🇸 Spanish language: `{es_count}`\n"
             f"🇬🇧 English language: `{en_count}`\n"
             f"👀 Movies seen: `{MOVIES_SEEN}`\n"
-            f"💾 Cache size: `{cache_size} MB`\n"
+            f"💾 Pages cache: `{PAGE_CACHE.stats()}`\n"
+            f"🗂 Language cache: `{LANG_CACHE.stats()}`\n"
+            f"🎬 Movies cache: `{MOVIES.stats()}`\n"
+            f"🎞 Stills cache: `{STILLS.stats()}`\n"
+            f"🔮 Prefetches: `{PREFETCHER.stats()}`\n"
+            f"🖋 Rendered cache: `{RENDERED.stats()}`\n"
+            f"🌐 FilmAffinity: `{FETCHER.stats()}`\n"
+            f"🚦 FilmAffinity queue: `{UPSTREAM.stats()}`\n"
+            f"🔎 Searches cache: `{SEARCHES.stats()}`\n"
+            f"⌨ Inline searches: `{INLINE_SEARCHES.stats()}`\n"
+            f"🔝 Tops: `{TOPS.stats()}`\n"
+            f"🖼 Media cache: `{MEDIA.stats()}`\n"
+            f"💽 DB writer: `{WRITER.stats()}`\n"
+            f"♨ Snapshot: `{SNAPSHOT.stats()}`\n"
+            f"🌡 FilmAffinity requests in the first minute: "
+            f"`{first_minute}`\n"
+            f"📝 Logs sent: `{LOGS_HANDLER.sent}`, "
+            f"dropped: `{LOGS_HANDLER.dropped}`\n"
             f"⏱ Bot uptime: `{uptime}`\n"
         )
     )
+    await event.respond(
+        message=f"⏲ Metrics:\n```{METRICS.summary()[:4000] or '-'}```"
+    )
 
     raise StopPropagation
 
 
+def count_first_minute():
+    """
+    Records the requests to FilmAffinity of the first minute up, the ones
+    saved by the snapshot.
+    """
+    global FIRST_MINUTE_REQUESTS
+    FIRST_MINUTE_REQUESTS = FETCHER.requests
+    logging.info(
+        f"{FIRST_MINUTE_REQUESTS} requests to FilmAffinity in the first minute"
+    )
+
+
+def start_parsers():
+    """
+    Forks all the parser processes, called before any other thread is
+    started. Python 3.9 forks them on demand, so the later ones would be
+    forked after the threads of the bot and could inherit a lock held by
+    one of them.
+    """
+    for _ in range(PARSE_WORKERS - len(PARSERS._processes)):
+        PARSERS._adjust_process_count()
+
+
 async def main():
     global db_conn
+    loop = asyncio.get_event_loop()
+    start_parsers()
+    loop.set_default_executor(EXECUTOR)
+    await METRICS.serve(METRICS_HOST, METRICS_PORT)
     db_conn = await aiosqlite.connect(str(DB))
+    await WRITER.setup(db_conn)
+    await BROADCASTS.setup(str(DB))
+    await MEDIA.setup(db_conn)
+    await USER_STATS.setup(db_conn)
+    await PAGE_CACHE.setup()
+    if OLD_PAGE_CACHE_DB.exists():
+        size = round(OLD_PAGE_CACHE_DB.stat().st_size / 1024 / 1024, 2)
+        OLD_PAGE_CACHE_DB.unlink()
+        logging.info(f"Deleted the old cache {OLD_PAGE_CACHE_DB} of {size} MB")
+    WRITER.start()
+    PAGE_CACHE.start()
+    # the snapshot is loaded while the bot connects
+    asyncio.ensure_future(SNAPSHOT.load(db_conn))
+    SNAPSHOT.start()
+    loop.call_later(60, count_first_minute)
     await bot.start(bot_token=BOT_TOKEN)
     await bot.get_me()
+    LOGS_HANDLER.start()
+    TOPS.start()
+    await BROADCASTS.resume()
 
 
 async def stop():
+    await BROADCASTS.stop()
+    await LOGS_HANDLER.stop()
     await bot.disconnect()
+    await TOPS.stop()
+    await SNAPSHOT.stop()
+    PREFETCHER.shed()
+    await FETCHER.close()
+    await METRICS.stop()
+    await WRITER.stop()
+    await PAGE_CACHE.stop()
     await db_conn.close()
+    PARSERS.shutdown()
 
 if __name__ == "__main__":
     loop = asyncio.get_event_loop()
@@ -0,0 +1,342 @@
+from typing import Dict, List, Optional, Tuple
+import time
+import asyncio
+import logging
+
+import aiosqlite
+from telethon import TelegramClient
+from telethon.tl.custom import Message
+from telethon.errors import FloodWaitError
+from telethon.errors.rpcerrorlist import UserIsBlockedError, UserIsBotError, \
+    PeerIdInvalidError, ChannelPrivateError, ChatWriteForbiddenError, \
+    ChatAdminRequiredError, InputUserDeactivatedError
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS broadcast (
+    id              INTEGER     PRIMARY KEY AUTOINCREMENT,
+    lang            VARCHAR(3)  NOT NULL,
+    chat_id         INT64       NOT NULL,
+    msg_id          INT64       NOT NULL,
+    progress_msg_id INT64       NOT NULL,
+    status          VARCHAR(7)  DEFAULT 'running'   NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcast_recipient (
+    broadcast_id    INTEGER     NOT NULL,
+    tid             INT64       NOT NULL,
+    status          VARCHAR(7)  DEFAULT 'pending'   NOT NULL,
+    PRIMARY KEY (broadcast_id, tid)
+);
+"""
+PROGRESS_TEXT = (
+    '📢 Broadcasting to `{}` users...\n'
+    '🚫 Errors: `{}`\n'
+    '✅ Broadcast: `{}/{}`'
+)
+# errors of recipients that can't receive the message
+RECIPIENT_ERRORS = (
+    ValueError,
+    UserIsBlockedError,
+    UserIsBotError,
+    PeerIdInvalidError,
+    ChannelPrivateError,
+    ChatWriteForbiddenError,
+    ChatAdminRequiredError,
+    InputUserDeactivatedError
+)
+
+
+class TokenBucket:
+    """
+    Rate limiter allowing `rate` acquisitions per second with bursts of up
+    to `capacity`. Can be paused to honor Telegram's flood waits.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Broadcaster:
+    """
+    Sends a message to the users of the bot with bounded concurrency and
+    rate.
+
+    The broadcast and the status of each recipient are saved in the DB, so
+    a broadcast interrupted by a restart is resumed skipping the recipients
+    already reached. They are committed through its own connection, so the
+    commits don't end a transaction of the writes batched by others.
+    """
+
+    def __init__(
+        self,
+        client: TelegramClient,
+        concurrency: int = 10,
+        rate: float = 25,
+        progress_interval: float = 5
+    ):
+        self.client = client
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, capacity=concurrency)
+        self.progress_interval = progress_interval
+        self.db_conn: Optional[aiosqlite.Connection] = None
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    async def setup(self, path: str):
+        self.db_conn = db_conn = await aiosqlite.connect(path)
+        await db_conn.executescript(SCHEMA)
+        await db_conn.commit()
+
+    async def create(self, lang: str, msg: Message, progress_msg: Message) -> int:
+        """
+        Saves a new broadcast of msg to the users with lang, or all.
+        """
+        cursor = await self.db_conn.execute(
+            "INSERT INTO broadcast (lang, chat_id, msg_id, progress_msg_id) "
+            "VALUES (?, ?, ?, ?)",
+            (lang, msg.chat_id, msg.id, progress_msg.id, )
+        )
+        broadcast_id = cursor.lastrowid
+
+        if lang == "all":
+            await self.db_conn.execute(
+                "INSERT INTO broadcast_recipient (broadcast_id, tid) "
+                "SELECT ?, tid FROM user",
+                (broadcast_id, )
+            )
+        else:
+            await self.db_conn.execute(
+                "INSERT INTO broadcast_recipient (broadcast_id, tid) "
+                "SELECT ?, tid FROM user WHERE lang = ?",
+                (broadcast_id, lang, )
+            )
+        await self.db_conn.commit()
+
+        return broadcast_id
+
+    def start(self, broadcast_id: int):
+        task = asyncio.ensure_future(self._run(broadcast_id))
+        self._tasks[broadcast_id] = task
+        task.add_done_callback(lambda task: self._done(broadcast_id, task))
+
+    def _done(self, broadcast_id: int, task: asyncio.Task):
+        self._tasks.pop(broadcast_id, None)
+        # a broadcast cancelled by a stop is resumed on the next start
+        if task.cancelled() or task.exception() is None:
+            return
+
+        error = task.exception()
+        logging.error(
+            f"Broadcast {broadcast_id} failed: {error!r}", exc_info=error
+        )
+        report = asyncio.ensure_future(self._report(broadcast_id, error))
+        self._tasks[broadcast_id] = report
+        report.add_done_callback(lambda _: self._tasks.pop(broadcast_id, None))
+
+    async def _report(self, broadcast_id: int, error: BaseException):
+        """
+        Marks a broadcast as failed and tells the admin on its progress
+        message.
+        """
+        try:
+            await self.db_conn.execute(
+                "UPDATE broadcast SET status = 'failed' WHERE id = ?",
+                (broadcast_id, )
+            )
+            await self.db_conn.commit()
+
+            async with self.db_conn.execute(
+                "SELECT chat_id, progress_msg_id FROM broadcast WHERE id = ?",
+                (broadcast_id, )
+            ) as cursor:
+                chat_id, progress_msg_id = await cursor.fetchone()
+
+            await self.client.send_message(
+                chat_id,
+                message=f"❌ Broadcast failed: `{error!r}`",
+                reply_to=progress_msg_id
+            )
+        except Exception as e:
+            logging.error(
+                f"Reporting the failure of broadcast {broadcast_id} "
+                f"failed: {e!r}"
+            )
+
+    async def resume(self):
+        """
+        Starts again the broadcasts interrupted by a restart.
+        """
+        async with self.db_conn.execute(
+            "SELECT id FROM broadcast WHERE status = 'running'"
+        ) as cursor:
+            async for (broadcast_id, ) in cursor:
+                logging.info(f"Resuming broadcast {broadcast_id}")
+                self.start(broadcast_id)
+
+    async def stop(self):
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if self.db_conn is not None:
+            await self.db_conn.close()
+
+    async def _counts(self, broadcast_id: int) -> Tuple[int, int, int]:
+        """
+        Returns the sent, failed and total recipients of a broadcast.
+        """
+        async with self.db_conn.execute(
+            "SELECT status, COUNT() FROM broadcast_recipient "
+            "WHERE broadcast_id = ? GROUP BY status",
+            (broadcast_id, )
+        ) as cursor:
+            counts = dict(await cursor.fetchall())
+
+        return (
+            counts.get("sent", 0),
+            counts.get("failed", 0),
+            sum(counts.values())
+        )
+
+    async def _send(self, msg: Message, tid: int) -> str:
+        """
+        Sends msg to a recipient, returns its new status.
+        """
+        attempts = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self.client.send_message(entity=tid, message=msg)
+                return "sent"
+            except RECIPIENT_ERRORS:
+                return "failed"
+            except FloodWaitError as e:
+                # all the workers wait, the attempt is not counted
+                logging.warning(f"Broadcast flood wait of {e.seconds} seconds")
+                self.bucket.pause(e.seconds)
+            except Exception as e:
+                logging.warning(f"Broadcast to {tid} failed: {type(e)}: {e}")
+                attempts += 1
+                if attempts == 3:
+                    return "failed"
+                await asyncio.sleep(2 ** attempts)
+
+    async def _worker(self, msg: Message, queue: asyncio.Queue, results: List):
+        while True:
+            tid = await queue.get()
+            try:
+                results.append((await self._send(msg, tid), tid))
+            finally:
+                queue.task_done()
+
+    async def _save(self, broadcast_id: int, results: List):
+        # the workers keep adding results while saving
+        batch = [(status, broadcast_id, tid) for status, tid in results]
+        results.clear()
+
+        if batch:
+            await self.db_conn.executemany(
+                "UPDATE broadcast_recipient SET status = ? "
+                "WHERE broadcast_id = ? AND tid = ?",
+                batch
+            )
+            await self.db_conn.commit()
+
+    async def _progress(
+        self,
+        broadcast_id: int,
+        lang: str,
+        chat_id: int,
+        progress_msg_id: int
+    ):
+        sent, failed, total = await self._counts(broadcast_id)
+        try:
+            await self.client.edit_message(
+                chat_id,
+                progress_msg_id,
+                text=PROGRESS_TEXT.format(lang, failed, sent, total)
+            )
+        except Exception as e:
+            # unchanged text or deleted message, the broadcast goes on
+            logging.debug(e)
+
+    async def _run(self, broadcast_id: int):
+        async with self.db_conn.execute(
+            "SELECT lang, chat_id, msg_id, progress_msg_id FROM broadcast "
+            "WHERE id = ?",
+            (broadcast_id, )
+        ) as cursor:
+            lang, chat_id, msg_id, progress_msg_id = await cursor.fetchone()
+
+        msg = await self.client.get_messages(chat_id, ids=msg_id)
+        if msg is None:
+            raise ValueError(f"Message of broadcast {broadcast_id} not found")
+
+        async with self.db_conn.execute(
+            "SELECT tid FROM broadcast_recipient "
+            "WHERE broadcast_id = ? AND status = 'pending'",
+            (broadcast_id, )
+        ) as cursor:
+            pending = [tid for (tid, ) in await cursor.fetchall()]
+
+        queue = asyncio.Queue()
+        for tid in pending:
+            queue.put_nowait(tid)
+
+        results = []
+        workers = [
+            asyncio.ensure_future(self._worker(msg, queue, results))
+            for _ in range(self.concurrency)
+        ]
+        done = asyncio.ensure_future(queue.join())
+
+        try:
+            while not done.done():
+                await asyncio.wait([done], timeout=self.progress_interval)
+                await self._save(broadcast_id, results)
+                await self._progress(broadcast_id, lang, chat_id, progress_msg_id)
+        finally:
+            done.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            # save the recipients reached before an interruption
+            await self._save(broadcast_id, results)
+
+        await self.db_conn.execute(
+            "UPDATE broadcast SET status = 'done' WHERE id = ?",
+            (broadcast_id, )
+        )
+        await self.db_conn.commit()
+
+        await self.client.send_message(
+            chat_id,
+            message="✅ Done!!!",
+            reply_to=progress_msg_id
+        )
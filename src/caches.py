@@ -0,0 +1,190 @@
+from typing import Any, Hashable, Iterable, List, Optional, Tuple
+from collections import OrderedDict
+import sys
+import time
+
+
+_MISSING = object()
+
+
+def deep_sizeof(obj: Any) -> int:
+    """
+    Approximated memory footprint in bytes of obj and the containers and
+    strings it references.
+    """
+    seen = set()
+    stack = [obj]
+    size = 0
+
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+
+    return size
+
+
+class TTLCache:
+    """
+    Bounded in-memory mapping with LRU eviction and a time to live for the
+    entries. Keeps hit/miss counters to be shown to the admin.
+
+    Optionally the approximated memory footprint of the values can be capped
+    with max_bytes.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # bytes of the values, only tracked if max_bytes is set
+        self.size_bytes = 0
+        # key -> (expiration time, value, size), least recently used first
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        """
+        Returns the value for key if present and not expired, else default.
+        """
+        entry = self._data.get(key)
+
+        if entry is not None:
+            expires, value, _ = entry
+            if expires is None or expires > time.monotonic():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+
+            self.pop(key)
+
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any):
+        """
+        Stores the value for key, evicting the least recently used entries
+        if the cache is full.
+        """
+        self.pop(key)
+
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        size = deep_sizeof(value) if self.max_bytes else 0
+        self._data[key] = (expires, value, size)
+        self.size_bytes += size
+
+        while len(self._data) > self.maxsize or (
+            self.max_bytes and self.size_bytes > self.max_bytes and
+            len(self._data) > 1
+        ):
+            _, (_, _, size) = self._data.popitem(last=False)
+            self.size_bytes -= size
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Removes key from the cache, returns its value or default.
+        """
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return default
+
+        self.size_bytes -= entry[2]
+        return entry[1]
+
+    def clear(self):
+        self._data.clear()
+        self.size_bytes = 0
+
+    def dump(self, limit: int) -> List[Tuple[Hashable, Any, Optional[float]]]:
+        """
+        The `limit` most recently used entries as (key, value, seconds to
+        expire), the most recent first.
+        """
+        now = time.monotonic()
+        entries = []
+        for key, (expires, value, _) in reversed(self._data.items()):
+            if len(entries) >= limit:
+                break
+            if expires is None:
+                entries.append((key, value, None))
+            elif expires > now:
+                entries.append((key, value, expires - now))
+
+        return entries
+
+    def load(
+        self,
+        entries: Iterable[Tuple[Hashable, Any, Optional[float]]]
+    ) -> int:
+        """
+        Restores entries made by dump(), as less recently used than the ones
+        already cached, which are kept. Returns the number restored.
+        """
+        now = time.monotonic()
+        restored = 0
+        for key, value, ttl in entries:
+            if key in self._data or (ttl is not None and ttl <= 0):
+                continue
+
+            size = deep_sizeof(value) if self.max_bytes else 0
+            if len(self._data) >= self.maxsize or (
+                self.max_bytes and self.size_bytes + size > self.max_bytes
+            ):
+                break
+
+            expires = now + ttl if ttl is not None else None
+            self._data[key] = (expires, value, size)
+            self._data.move_to_end(key, last=False)
+            self.size_bytes += size
+            restored += 1
+
+        return restored
+
+    def memory_usage(self) -> int:
+        """
+        Approximated memory footprint in bytes of the cached values.
+        """
+        if self.max_bytes:
+            return self.size_bytes
+
+        return sum(deep_sizeof(value) for _, value, _ in self._data.values())
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the cache counters.
+        """
+        return (
+            f"{len(self)}/{self.maxsize} entries, "
+            f"{self.hits} hits, {self.misses} misses "
+            f"({self.hit_ratio:.0%})"
+        )
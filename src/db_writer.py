@@ -0,0 +1,112 @@
+from typing import Any, Deque, Iterable, List, Optional, Tuple
+from collections import deque
+from itertools import groupby
+import asyncio
+import logging
+import sqlite3
+
+import aiosqlite
+
+
+Write = Tuple[str, Iterable[Any]]
+
+
+class DBWriter:
+    """
+    Write-behind queue of the DB writes whose result the handlers don't
+    wait for.
+
+    The writes are executed by a background task every `interval` seconds,
+    grouped in transactions of up to `max_batch` writes, so a burst of
+    writes costs a few commits instead of one per write. The DB is switched
+    to WAL mode, so the commits don't block the readers.
+    """
+
+    def __init__(self, interval: float = 1, max_batch: int = 1000):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.db_conn: Optional[aiosqlite.Connection] = None
+        self.writes = 0
+        self.commits = 0
+        self.errors = 0
+        self._pending: Deque[Write] = deque()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def setup(self, db_conn: aiosqlite.Connection):
+        self.db_conn = db_conn
+        await db_conn.execute("PRAGMA journal_mode = WAL")
+        # in WAL mode only a power loss can lose the last commits
+        await db_conn.execute("PRAGMA synchronous = NORMAL")
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def write(self, sql: str, parameters: Iterable[Any] = ()):
+        """
+        Queues a write, it is committed in the next flush.
+        """
+        self._pending.append((sql, parameters))
+
+    async def _commit(self, batch: List[Write]):
+        # consecutive writes with the same statement go in one executemany
+        for sql, writes in groupby(batch, key=lambda write: write[0]):
+            rows = [parameters for _, parameters in writes]
+            try:
+                await self.db_conn.executemany(sql, rows)
+            except sqlite3.Error as e:
+                self.errors += len(rows)
+                logging.error(f"Failed {len(rows)} writes of `{sql}`: {e}")
+
+        await self.db_conn.commit()
+        self.writes += len(batch)
+        self.commits += 1
+
+    async def flush(self):
+        """
+        Commits all the pending writes.
+        """
+        async with self._lock:
+            while self._pending:
+                batch = [
+                    self._pending.popleft()
+                    for _ in range(min(self.max_batch, len(self._pending)))
+                ]
+                await self._commit(batch)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # a flush in progress is completed even if the task is stopped
+                await asyncio.shield(self.flush())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"DB writer flush failed: {e!r}")
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Stops the background task and commits the pending writes.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+        await self.flush()
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the writer counters.
+        """
+        return (
+            f"{self.writes} writes in {self.commits} commits, "
+            f"{self.pending} pending, {self.errors} errors"
+        )
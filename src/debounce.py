@@ -0,0 +1,86 @@
+from typing import Dict, Hashable, Callable, Awaitable, Any, Set
+import asyncio
+
+
+class Superseded(Exception):
+    """
+    The call was dropped because a newer one with the same key arrived.
+    """
+
+
+class Debouncer:
+    """
+    Runs only the latest call made for each key.
+
+    A call waits `delay` seconds before running, if a newer call for the
+    same key arrives meanwhile, or while it is running, the older one is
+    cancelled and its caller gets Superseded.
+    """
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.calls = 0
+        # calls dropped while waiting and while running
+        self.debounced = 0
+        self.cancelled = 0
+        self._latest: Dict[Hashable, asyncio.Task] = {}
+        # tasks cancelled by a newer call, not by the cancellation of their
+        # caller, which also cancels them
+        self._superseded: Set[asyncio.Task] = set()
+
+    async def run(
+        self,
+        key: Hashable,
+        func: Callable[..., Awaitable],
+        *args,
+        **kwargs
+    ) -> Any:
+        self.calls += 1
+
+        previous = self._latest.get(key)
+        if previous is not None and previous.cancel():
+            self._superseded.add(previous)
+
+        task = asyncio.ensure_future(self._delayed(func, *args, **kwargs))
+        self._latest[key] = task
+
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task in self._superseded:
+                raise Superseded from None
+            # the caller was cancelled, not replaced
+            task.cancel()
+            raise
+        finally:
+            self._superseded.discard(task)
+            if self._latest.get(key) is task:
+                del self._latest[key]
+
+    async def _delayed(self, func: Callable[..., Awaitable], *args, **kwargs):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            if asyncio.current_task() in self._superseded:
+                self.debounced += 1
+            raise
+
+        try:
+            return await func(*args, **kwargs)
+        except asyncio.CancelledError:
+            if asyncio.current_task() in self._superseded:
+                self.cancelled += 1
+            raise
+
+    @property
+    def avoided(self) -> int:
+        return self.debounced + self.cancelled
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the debouncer counters.
+        """
+        return (
+            f"{self.calls} calls, {self.avoided} avoided "
+            f"({self.debounced} debounced, {self.cancelled} cancelled)"
+        )
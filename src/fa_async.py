@@ -0,0 +1,386 @@
+from typing import Any, Awaitable, Callable, List, Dict, Optional
+from urllib.parse import quote
+from functools import partial
+from contextlib import asynccontextmanager
+from concurrent.futures import Executor
+import asyncio
+import logging
+
+from bs4 import BeautifulSoup
+from python_filmaffinity import FilmAffinity
+from python_filmaffinity.pages import DetailPage, ImagesPage
+from python_filmaffinity.exceptions import FilmAffinityConnectionError
+
+from bot_types import FAMovie
+from fetch import Fetcher
+from metrics import METRICS
+from page_cache import PageCache, CachedPage
+from scheduler import UpstreamScheduler, current_priority
+import fa_parser
+
+
+# services in /top -> FilmAffinity top category
+TOP_SERVICES = {
+    "HBO": "new_hbo_es",
+    "Netflix": "new_netflix",
+    "Filmin": "new_filmin",
+    "Movistar": "new_movistar_f",
+    "Rakuten": "new_rakuten",
+}
+SEARCH_FIELDS = ("title", "director", "cast")
+
+
+# lang -> client used for parsing in this process
+_PARSE_CLIENTS: Dict[str, FilmAffinity] = {}
+
+
+def _parse_client(lang: str) -> FilmAffinity:
+    client = _PARSE_CLIENTS.get(lang)
+    if client is None:
+        client = FilmAffinity(lang=lang, cache_backend="memory")
+        _PARSE_CLIENTS[lang] = client
+
+    return client
+
+
+class _Response:
+    """
+    Minimal response-like object expected by the FilmAffinity parsers.
+    """
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+
+def to_record(data):
+    """
+    Copy of the parsed data made only of plain dicts, lists and strings, so
+    no reference to the parsed document is kept or pickled.
+    """
+    if isinstance(data, dict):
+        return {key: to_record(value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [to_record(value) for value in data]
+    if isinstance(data, str):
+        return str(data)
+
+    return data
+
+
+def init_parser_process():
+    """
+    Initializer of the processes of a parser pool forked from the bot: only
+    its records to stderr are kept, not the ones sent to Telegram.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        if type(handler) is not logging.StreamHandler:
+            root.removeHandler(handler)
+
+
+# the parsers are module functions taking and returning plain data, so they
+# can run in a process pool
+
+
+def parse_search(lang: str, content: bytes, top: int) -> List[FAMovie]:
+    return to_record(_parse_client(lang)._return_list_movies(
+        _Response(content), "search", top
+    ))
+
+
+def parse_top_service(lang: str, content: bytes, top: int) -> List[FAMovie]:
+    return to_record(_parse_client(lang)._return_list_movies(
+        _Response(content), "top_service", top
+    ))
+
+
+def parse_movie(lang: str, content: bytes, mid: str) -> FAMovie:
+    soup = BeautifulSoup(content, "html.parser")
+    if not soup.find_all("div", {"class": "z-movie"}):
+        return {}
+
+    return to_record(_parse_client(lang)._get_movie_data(DetailPage(soup), mid))
+
+
+def parse_images(content: bytes) -> Dict[str, List[Dict[str, str]]]:
+    soup = BeautifulSoup(content, "html.parser")
+    if not soup.find_all("div", {"id": "main-image-wrapper"}):
+        return {
+            "posters": [],
+            "stills": [],
+            "promo": [],
+            "events": [],
+            "shootings": []
+        }
+
+    page = ImagesPage(soup)
+    return to_record({
+        "posters": page.get_posters(),
+        "stills": page.get_stills(),
+        "promo": page.get_promos(),
+        "events": page.get_events(),
+        "shootings": page.get_shootings(),
+    })
+
+
+# name -> parsers of the pages, the ones of python_filmaffinity are kept as
+# fallback in case the lxml ones break with a change of the pages
+PAGE_PARSERS = {
+    "bs4": {
+        "search": parse_search,
+        "top_service": parse_top_service,
+        "movie": parse_movie,
+        "images": parse_images,
+    },
+    "lxml": {
+        "search": fa_parser.parse_search,
+        "top_service": fa_parser.parse_top_service,
+        "movie": fa_parser.parse_movie,
+        "images": fa_parser.parse_images,
+    },
+}
+
+
+class AsyncFilmAffinity:
+    """
+    FilmAffinity client that downloads the pages with the async Fetcher and
+    parses them in the executor, the default one of the loop if not given,
+    with the parsers of PAGE_PARSERS named by `parser`. The pages are kept
+    in the page cache if given.
+
+    Mirrors the methods of the sync client used by the bot.
+    """
+
+    def __init__(
+        self,
+        client: FilmAffinity,
+        fetcher: Fetcher,
+        executor: Optional[Executor] = None,
+        parser: str = "lxml",
+        cache: Optional[PageCache] = None,
+        scheduler: Optional[UpstreamScheduler] = None
+    ):
+        self.client = client
+        self.lang = client.lang
+        self.fetcher = fetcher
+        self.executor = executor
+        self.parsers = PAGE_PARSERS[parser]
+        self.cache = cache
+        self.scheduler = scheduler
+        # url -> background revalidation of its stale page
+        self._revalidations: Dict[str, asyncio.Task] = {}
+
+    async def _load(
+        self,
+        url: str,
+        kind: str,
+        parse: Callable[[bytes], Awaitable],
+        valid: Callable[[Any], bool] = bool,
+        allow_stale: bool = True
+    ) -> Any:
+        """
+        Returns the page at url parsed by parse, from the page cache if there.
+
+        A stale page is returned at once and revalidated in background, or
+        with allow_stale=False revalidated first and only returned if that
+        fails. Only the downloaded pages whose parsed data is valid are
+        cached, kind is one of the kinds of pages of the cache.
+        """
+        page = None
+        if self.cache is not None:
+            page = await self.cache.lookup(url)
+            if page is not None and (page.fresh or allow_stale):
+                if not page.fresh:
+                    self._revalidate(url, kind, parse, valid, page)
+                return await parse(page.content)
+
+        try:
+            return await self._download(url, kind, parse, valid, page)
+        except FilmAffinityConnectionError as e:
+            if page is None:
+                raise
+            logging.info(f"Serving the stale copy of {url}: {e}")
+            return await parse(page.content)
+
+    async def _download(
+        self,
+        url: str,
+        kind: str,
+        parse: Callable[[bytes], Awaitable],
+        valid: Callable[[Any], bool],
+        page: Optional[CachedPage]
+    ) -> Any:
+        """
+        Downloads and parses the page at url, conditionally if there is a
+        stale copy of it.
+        """
+        async with self._upstream():
+            if page is None:
+                fetched = await self.fetcher.fetch(url)
+            else:
+                fetched = await self.fetcher.fetch(
+                    url, page.etag, page.modified
+                )
+            if fetched.body is not None:
+                data = await parse(fetched.body)
+
+        if fetched.body is None:
+            await self.cache.refresh(url, kind)
+            return await parse(page.content)
+
+        if not valid(data):
+            # an empty or changed page doesn't replace a good copy
+            if page is not None:
+                logging.info(f"Keeping the stale copy of {url}: invalid page")
+                return await parse(page.content)
+        elif self.cache is not None:
+            await self.cache.set(
+                url, kind, fetched.body, fetched.etag, fetched.last_modified
+            )
+
+        return data
+
+    def _revalidate(
+        self,
+        url: str,
+        kind: str,
+        parse: Callable[[bytes], Awaitable],
+        valid: Callable[[Any], bool],
+        page: CachedPage
+    ):
+        # while FilmAffinity is failing the stale pages are served as they are
+        if url in self._revalidations or self.fetcher.breaker.is_open:
+            return
+
+        task = asyncio.ensure_future(
+            self._refresh(url, kind, parse, valid, page)
+        )
+        self._revalidations[url] = task
+        task.add_done_callback(lambda _: self._revalidations.pop(url, None))
+
+    async def _refresh(
+        self,
+        url: str,
+        kind: str,
+        parse: Callable[[bytes], Awaitable],
+        valid: Callable[[Any], bool],
+        page: CachedPage
+    ):
+        current_priority.set("background")
+        try:
+            async with self._upstream():
+                fetched = await self.fetcher.fetch(
+                    url, page.etag, page.modified
+                )
+                if fetched.body is not None:
+                    data = await parse(fetched.body)
+        except FilmAffinityConnectionError as e:
+            logging.info(f"Revalidation of {url} failed: {e}")
+            return
+
+        if fetched.body is None:
+            await self.cache.refresh(url, kind)
+        elif valid(data):
+            await self.cache.set(
+                url, kind, fetched.body, fetched.etag, fetched.last_modified
+            )
+
+    @asynccontextmanager
+    async def _upstream(self):
+        """
+        Slot of the scheduler for a download and its parsing, if any.
+        """
+        if self.scheduler is None:
+            yield
+        else:
+            async with self.scheduler.slot():
+                yield
+
+    async def _parse(self, func, *args):
+        with METRICS.time("fa_parse_seconds", parser=func.__name__):
+            return await asyncio.get_event_loop().run_in_executor(
+                self.executor, partial(func, *args)
+            )
+
+    async def search(self, top: int = 10, **kwargs) -> List[FAMovie]:
+        """
+        Search movies by title, director or cast.
+        """
+        top = min(top, 20)
+        fields = [(key, kwargs[key]) for key in SEARCH_FIELDS if key in kwargs]
+        if not fields:
+            return []
+
+        adv_options = "".join(
+            f"stext={quote(str(value))}&stype[]={key}&"
+            for key, value in fields
+        )
+        adv_url = self.client.url + "advsearch.php?" + adv_options
+
+        def parse(content: bytes) -> Awaitable[List[FAMovie]]:
+            return self._parse(self.parsers["search"], self.lang, content, top)
+
+        if [key for key, _ in fields] == ["title"]:
+            url = (
+                self.client.url + "search.php?stype=title&stext=" +
+                quote(str(kwargs["title"]))
+            )
+            movies = await self._load(url, "search", parse)
+            if movies:
+                return movies
+
+        return await self._load(adv_url, "search", parse)
+
+    async def get_movie(self, id: str, images: bool = False) -> FAMovie:
+        """
+        Details of the movie, the images page is downloaded at the same time
+        if requested.
+        """
+        details = self._load(
+            self.client.url_film + str(id) + ".html",
+            "movie",
+            lambda content: self._parse(
+                self.parsers["movie"], self.lang, content, id
+            )
+        )
+        if not images:
+            return await details
+
+        movie, movie_images = await asyncio.gather(
+            details, self.get_images(id)
+        )
+        if movie:
+            movie["images"] = movie_images
+
+        return movie
+
+    async def get_images(self, id: str) -> Dict[str, List[Dict[str, str]]]:
+        """
+        Images of the movie by type, without its details.
+        """
+        return await self._load(
+            self.client.url_images + str(id),
+            "images",
+            lambda content: self._parse(self.parsers["images"], content),
+            valid=lambda images: any(images.values())
+        )
+
+    async def top(
+        self,
+        service: str,
+        top: int = 10,
+        allow_stale: bool = True
+    ) -> List[FAMovie]:
+        """
+        Top movies of a service, one of TOP_SERVICES.
+        """
+        url = self.client.url + "topcat.php?id=" + TOP_SERVICES[service]
+
+        return await self._load(
+            url,
+            "top",
+            lambda content: self._parse(
+                self.parsers["top_service"], self.lang, content, min(top, 40)
+            ),
+            allow_stale=allow_stale
+        )
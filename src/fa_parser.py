@@ -0,0 +1,665 @@
+from typing import Callable, Dict, Iterator, List, Optional, Union
+import logging
+import re
+
+from lxml import etree
+import lxml.html
+
+from bot_types import FAMovie
+
+
+# Parsers of the FilmAffinity pages used by the bot, built on lxml with
+# precompiled XPath expressions. They return the same data as the parsers of
+# python_filmaffinity (see fa_async), quirks included, so they are checked
+# against them by benchmarks/parser_check.py on the recorded pages.
+
+Node = Union[etree._Element, str]
+
+HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+
+# FilmAffinity classifications found among the directors and the actors
+CLASSIFICATIONS = ("Documentary", "Animation", "Tv Series", "TV Miniseries")
+TITLE_YEAR = re.compile(
+    r'(.+[^0-9|^(|^\[])[([|\[| |.|_]*(19\d\d|20\d\d)[)|\]]?', re.IGNORECASE
+)
+THUMBNAIL = re.compile(r"\((.*?)\)", re.IGNORECASE)
+IMAGE_COUNTRY = re.compile(r">Pa[ií]s: </strong>(.*?)</div>")
+IMAGE_COUNTRY_DIV = re.compile(r"<div>(.*?)</div>")
+
+# image type -> id of its section in the images page
+IMAGE_SECTIONS = {
+    "posters": "type_imgs_2",
+    "stills": "type_imgs_9",
+    "promo": "type_imgs_8",
+    "events": "type_imgs_11",
+    "shootings": "type_imgs_13",
+}
+
+
+def _class(*names: str) -> str:
+    """
+    XPath predicate matching elements with any of the classes.
+    """
+    return " or ".join(
+        f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+        for name in names
+    )
+
+
+def _xpath(path: str) -> etree.XPath:
+    return etree.XPath(path, smart_strings=False)
+
+
+# text of an element, without the contents of scripts and styles
+TEXT = _xpath(".//text()[not(ancestor::script or ancestor::style)]")
+
+MOVIE_CARDS = _xpath(f"//*[({_class('movie-card')}) and @data-movie-id]")
+TOP_MOVIE_CARDS = _xpath(
+    f"//*[{_class('top-movie')}]"
+    f"//*[({_class('movie-card')}) and @data-movie-id]"
+)
+
+# movie details
+Z_MOVIE = _xpath(f"//div[{_class('z-movie')}]")
+RATE_MOVIE_BOX = _xpath(f"//div[{_class('rate-movie-box')}]")
+TITLE = _xpath("//span[@itemprop='name']")
+MOVIE_INFO = _xpath(f"//dl[{_class('movie-info')}]")
+DD = _xpath(".//dd")
+SPAN = _xpath(".//span")
+DATE_PUBLISHED = _xpath("//dd[@itemprop='datePublished']")
+DURATION = _xpath("//dd[@itemprop='duration']")
+RATING = _xpath("//div[@id='movie-rat-avg']")
+RATING_COUNT = _xpath("//span[@itemprop='ratingCount']")
+DESCRIPTION = _xpath("//dd[@itemprop='description']")
+DIRECTORS = _xpath("//span[@itemprop='director']")
+NAME_SPAN = _xpath(".//span[@itemprop='name']")
+DT = _xpath("//dt")
+NB = _xpath(f".//span[{_class('nb')}]")
+A = _xpath(".//a")
+ACTORS = _xpath("//li[@itemprop='actor']")
+NAME_DIV = _xpath(".//div[@itemprop='name']")
+PRODUCERS = _xpath(f"//dd[{_class('card-producer')}]")
+POSTER = _xpath("//img[@itemprop='image']")
+COUNTRY = _xpath("//span[@id='country-img']")
+IMG = _xpath(".//img")
+GENRES = _xpath("//span[@itemprop='genre']")
+AWARDS = _xpath(f"//dd[{_class('award')}]")
+REVIEWS = _xpath(f"//div[{_class('pro-review')}]")
+REVIEW_AUTHOR = _xpath(".//div[@itemprop='author']")
+REVIEW_BODY = _xpath(".//div[@itemprop='reviewBody']")
+
+# movie cards of the lists, relative to the card
+CARD_ID = _xpath(f".//*[({_class('movie-card')}) and @data-movie-id]")
+CARD_TITLE = _xpath(f".//div[{_class('mc-title')}]")
+CARD_RIGHT = _xpath(f".//div[{_class('mc-right')}]")
+H3 = _xpath(".//h3")
+CARD_YEAR = _xpath(f".//*[{_class('mc-year')}]")
+CARD_YEAR_W = _xpath(f".//div[{_class('ye-w')}]")
+CARD_DATA = _xpath(f".//div[{_class('mc-data')}]")
+DIV = _xpath(".//div")
+CARD_DURATION = _xpath(f".//div[{_class('duration')}]")
+CARD_RATING = _xpath(f".//*[{_class('avg', 'avg-rating', 'avgrat-box')}]")
+CARD_VOTES = _xpath(f".//*[{_class('count', 'rat-count', 'ratcount-box')}]")
+CARD_SYNOPSIS = _xpath(f".//a[{_class('synop-text')}]")
+CARD_DIRECTORS = _xpath(f".//div[{_class('director', 'mc-director')}]")
+CARD_CAST = _xpath(f".//div[{_class('cast', 'mc-cast')}]")
+CARD_POSTER = _xpath(f".//div[{_class('mc-poster')}]")
+CARD_FLAG = _xpath(f".//img[{_class('nflag')}]")
+CARD_COUNTRY = _xpath(f".//div[{_class('mc-data', 'mc-title')}]")
+CARD_GENRE = _xpath(f".//a[{_class('genre')}]")
+
+# images
+MAIN_IMAGE = _xpath("//div[@id='main-image-wrapper']")
+IMAGE_SECTION = _xpath("//div[@id=$id]")
+COLORBOX_IMAGES = _xpath(f".//div[{_class('colorbox-image')}]")
+
+
+def _document(content: bytes) -> etree._Element:
+    doc = etree.fromstring(content, HTML_PARSER) if content.strip() else None
+    # an empty page is parsed as an empty document, like bs4 does
+    return doc if doc is not None else lxml.html.Element("html")
+
+
+def _first(xpath: etree.XPath, node: etree._Element, **variables):
+    found = xpath(node, **variables)
+    return found[0] if found else None
+
+
+def _text(node: etree._Element) -> str:
+    return "".join(TEXT(node))
+
+
+# serialization of the nodes as done by bs4, used by the awards
+
+VOID_ELEMENTS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen",
+    "link", "menuitem", "meta", "param", "source", "track", "wbr",
+    "basefont", "bgsound", "command", "frame", "image", "isindex", "nextid",
+    "spacer",
+}
+LIST_ATTRIBUTES = {
+    "class", "rel", "rev", "accept-charset", "headers", "accesskey",
+    "dropzone",
+}
+
+
+def _escape(text: str) -> str:
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _attribute(name: str, value: str) -> str:
+    if name in LIST_ATTRIBUTES:
+        value = " ".join(value.split())
+    value = _escape(value)
+
+    if '"' not in value:
+        return f'{name}="{value}"'
+    if "'" not in value:
+        return f"{name}='{value}'"
+
+    return '{}="{}"'.format(name, value.replace('"', "&quot;"))
+
+
+def _html(node: etree._Element) -> str:
+    if node.tag is etree.Comment:
+        return f"<!--{node.text or ''}-->"
+    if not isinstance(node.tag, str):
+        return ""
+
+    raw = node.tag in ("script", "style")
+    # bs4 writes the attributes sorted by name
+    start = " ".join(
+        [node.tag] +
+        [_attribute(name, value) for name, value in sorted(node.items())]
+    )
+    if node.tag in VOID_ELEMENTS and not len(node) and not node.text:
+        return f"<{start}/>"
+
+    parts = [f"<{start}>"]
+    if node.text:
+        parts.append(node.text if raw else _escape(node.text))
+    for child in node:
+        parts.append(_html(child))
+        if child.tail:
+            parts.append(child.tail if raw else _escape(child.tail))
+    parts.append(f"</{node.tag}>")
+
+    return "".join(parts)
+
+
+def _next_siblings(node: etree._Element) -> Iterator[Node]:
+    """
+    Following siblings of the node, the texts between them included.
+    """
+    if node.tail:
+        yield node.tail
+    for sibling in node.itersiblings():
+        yield sibling
+        if sibling.tail:
+            yield sibling.tail
+
+
+def _str(node: Node) -> str:
+    if isinstance(node, str):
+        return node
+    # the comments are plain strings for bs4
+    if node.tag is etree.Comment:
+        return node.text or ""
+
+    return _html(node)
+
+
+def _text_without(node: etree._Element, skip: etree._Element) -> str:
+    """
+    Text of the node without the text of `skip`, one of its descendants.
+    """
+    parts = [node.text or ""] if isinstance(node.tag, str) else []
+    for child in node:
+        if child is not skip and child.tag not in ("script", "style"):
+            parts.append(_text_without(child, skip))
+        parts.append(child.tail or "")
+
+    return "".join(parts)
+
+
+def _float(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+
+    return float(re.sub(r"[^\d,.]", "", value).replace(",", "."))
+
+
+# movie details, the same as DetailPage
+
+
+def _detail_id(doc):
+    box = _first(RATE_MOVIE_BOX, doc)
+    return int(box.get("data-movie-id")) if box is not None else None
+
+
+def _detail_title(doc):
+    title = _first(TITLE, doc)
+    return _text(title).strip() if title is not None else None
+
+
+def _detail_original_title(doc):
+    info = _first(MOVIE_INFO, doc)
+    if info is None:
+        return None
+
+    dd = _first(DD, info)
+    if dd is None:
+        return None
+
+    return _text_without(dd, _first(SPAN, dd)).strip()
+
+
+def _detail_year(doc):
+    year = _first(DATE_PUBLISHED, doc)
+    return _text(year) if year is not None else None
+
+
+def _detail_duration(doc):
+    duration = _first(DURATION, doc)
+    return _text(duration) if duration is not None else ""
+
+
+def _detail_rating(doc):
+    rating = _first(RATING, doc)
+    if rating is None:
+        return None
+
+    content = rating.attrib["content"]
+    try:
+        return _float(content)
+    except ValueError:
+        return 0.0
+
+
+def _detail_votes(doc):
+    votes = _first(RATING_COUNT, doc)
+    if votes is None:
+        return None
+
+    content = votes.attrib["content"]
+    try:
+        return int(re.sub(r"[., ]", "", content))
+    except ValueError:
+        return None
+
+
+def _detail_description(doc):
+    description = _first(DESCRIPTION, doc)
+    return _text(description) if description is not None else None
+
+
+def _detail_directors(doc):
+    return [_text(NAME_SPAN(director)[0]) for director in DIRECTORS(doc)]
+
+
+def _credits(doc, label: str) -> List[str]:
+    names = []
+    for dt in DT(doc):
+        if _text(dt) != label:
+            continue
+
+        # the second sibling, usually the dd after the whitespace
+        siblings = _next_siblings(dt)
+        next(siblings)
+        dd = next(siblings)
+        if isinstance(dd, str):
+            raise AttributeError(f"no dd after the {label} dt")
+
+        names.extend(_text(A(nb)[0]) for nb in NB(dd))
+
+    return names
+
+
+def _detail_actors(doc):
+    try:
+        return [_text(NAME_DIV(actor)[0]) for actor in ACTORS(doc)]
+    except IndexError:
+        return []
+
+
+def _detail_producers(doc):
+    dd = _first(PRODUCERS, doc)
+    if dd is None:
+        return []
+
+    return [_text(A(nb)[0]) for nb in NB(dd)]
+
+
+def _detail_poster(doc):
+    image = _first(POSTER, doc)
+    return image.attrib["src"] if image is not None else None
+
+
+def _detail_country(doc):
+    country = _first(COUNTRY, doc)
+    if country is None:
+        return ""
+
+    return IMG(country)[0].attrib["alt"]
+
+
+def _detail_genre(doc):
+    genres = []
+    for genre in GENRES(doc):
+        link = _first(A, genre)
+        genres.append(_text(link) if link is not None else _text(genre).strip())
+
+    return genres
+
+
+def _detail_awards(doc):
+    dd = _first(AWARDS, doc)
+    if dd is None:
+        return []
+
+    awards = []
+    for a in A(dd):
+        award = "".join(_str(node) for node in _next_siblings(a)).strip()
+        awards.append({
+            "year": _text(a),
+            "award": award[2:] if award.startswith("- ") else award,
+        })
+
+    return awards
+
+
+def _detail_reviews(doc):
+    reviews = []
+    for review in REVIEWS(doc):
+        link = _first(A, review)
+        reviews.append({
+            "author": _text(REVIEW_AUTHOR(review)[0]),
+            "review": _text(REVIEW_BODY(review)[0]),
+            "url": link.attrib["href"] if link is not None else None,
+        })
+
+    return reviews
+
+
+# movie cards of the lists, the same as SearchPage and TopServicePage
+
+
+def _card_id(card):
+    if not card.get("data-movie-id"):
+        card = _first(CARD_ID, card)
+        if card is None:
+            return None
+
+    return card.get("data-movie-id")
+
+
+def _card_title(card):
+    title = _first(CARD_TITLE, card)
+    if title is None:
+        return None
+
+    link = _first(A, title)
+    return _text(link if link is not None else title).strip()
+
+
+def _top_card_title(card):
+    right = _first(CARD_RIGHT, card)
+    if right is not None:
+        title = _first(H3, right)
+        if title is not None:
+            return _text(title).strip()
+
+    return _card_title(card)
+
+
+def _card_year(card, get_title: Callable):
+    year = _first(CARD_YEAR, card)
+    if year is not None and _text(year).strip():
+        return _text(year).strip()
+
+    year = _first(CARD_YEAR_W, card)
+    if year is not None:
+        return _text(year).strip()
+
+    data = _first(CARD_DATA, card)
+    if data is not None:
+        return _text(DIV(data)[0])
+
+    match = TITLE_YEAR.match(get_title(card) or "")
+    return match.group(2) if match else None
+
+
+def _card_duration(card):
+    duration = _first(CARD_DURATION, card)
+    return _text(duration).strip() if duration is not None else None
+
+
+def _card_rating(card):
+    rating = _first(CARD_RATING, card)
+    try:
+        return _float(_text(rating) if rating is not None else None)
+    except ValueError:
+        return None
+
+
+def _card_votes(card):
+    votes = _first(CARD_VOTES, card)
+    return _text(votes).strip() if votes is not None else None
+
+
+def _card_description(card):
+    synopsis = _first(CARD_SYNOPSIS, card)
+    if synopsis is not None:
+        return _text(synopsis).strip()
+
+    data = _first(CARD_DATA, card)
+    return _text(CARD_SYNOPSIS(data)[0]) if data is not None else None
+
+
+def _card_people(cell) -> Optional[List[str]]:
+    names = []
+    for nb in NB(cell):
+        name = A(nb)[0].attrib["title"]
+        if name not in CLASSIFICATIONS:
+            names.append(name)
+
+    return names
+
+
+def _card_directors(card):
+    directors = _first(CARD_DIRECTORS, card)
+    if directors is None:
+        return []
+    if not NB(directors):
+        return None
+
+    return _card_people(directors)
+
+
+def _card_actors(card):
+    cast = _first(CARD_CAST, card)
+    if cast is None or not NB(cast):
+        return None
+
+    try:
+        return _card_people(cast)
+    except Exception:
+        return None
+
+
+def _image_src(image) -> Optional[str]:
+    if image is None:
+        return None
+    if image.get("data-src"):
+        return image.get("data-src")
+
+    srcset = image.get("data-srcset") or image.get("srcset")
+    if srcset:
+        return [part.strip().split()[0] for part in srcset.split(",")][-1]
+
+    src = image.get("src")
+    return None if src == "/images/empty.gif" else src
+
+
+def _card_poster(card):
+    poster = _first(CARD_POSTER, card)
+    return _image_src(_first(IMG, poster)) if poster is not None else None
+
+
+def _card_country(card):
+    flag = _first(CARD_FLAG, card)
+    if flag is not None and flag.get("alt"):
+        return flag.get("alt")
+
+    cell = _first(CARD_COUNTRY, card)
+    if cell is None:
+        return None
+
+    image = _first(IMG, cell)
+    return image.attrib["alt"] if image is not None else None
+
+
+def _card_genre(card):
+    genre = _first(CARD_GENRE, card)
+    if genre is not None:
+        return _text(genre).strip()
+
+    data = _first(CARD_DATA, card)
+    return _text(CARD_GENRE(data)[0]) if data is not None else None
+
+
+def _none(_):
+    return None
+
+
+def _empty(_):
+    return []
+
+
+# FAMovie field -> getter, in the order of the FAMovie dicts
+DETAIL_FIELDS = {
+    "id": _detail_id,
+    "title": _detail_title,
+    "original_title": _detail_original_title,
+    "year": _detail_year,
+    "duration": _detail_duration,
+    "rating": _detail_rating,
+    "votes": _detail_votes,
+    "description": _detail_description,
+    "directors": _detail_directors,
+    "writers": lambda doc: _credits(doc, "Guion"),
+    "music": lambda doc: _credits(doc, "Música"),
+    "cinematography": lambda doc: _credits(doc, "Fotografía"),
+    "actors": _detail_actors,
+    "producers": _detail_producers,
+    "poster": _detail_poster,
+    "country": _detail_country,
+    "genre": _detail_genre,
+    "awards": _detail_awards,
+    "reviews": _detail_reviews,
+}
+CARD_FIELDS = {
+    "id": _card_id,
+    "title": _card_title,
+    "original_title": _none,
+    "year": lambda card: _card_year(card, _card_title),
+    "duration": _card_duration,
+    "rating": _card_rating,
+    "votes": _card_votes,
+    "description": _card_description,
+    "directors": _card_directors,
+    "writers": _none,
+    "music": _none,
+    "cinematography": _none,
+    "actors": _card_actors,
+    "producers": _none,
+    "poster": _card_poster,
+    "country": _card_country,
+    "genre": _card_genre,
+    "awards": _empty,
+    "reviews": _empty,
+}
+TOP_CARD_FIELDS = dict(
+    CARD_FIELDS,
+    title=_top_card_title,
+    year=lambda card: _card_year(card, _top_card_title),
+)
+
+
+def _movie(node: etree._Element, fields: Dict[str, Callable], **known) -> FAMovie:
+    """
+    Movie data with the fields read from the node, the fields whose getter
+    fails are None.
+    """
+    movie = {}
+    for field, getter in fields.items():
+        if known.get(field):
+            movie[field] = known[field]
+            continue
+
+        try:
+            movie[field] = getter(node)
+        except Exception as e:
+            logging.warning(f"{field} field not found for {movie.get('id')}: {e!r}")
+            movie[field] = None
+
+    return movie
+
+
+def parse_search(lang: str, content: bytes, top: int) -> List[FAMovie]:
+    cards = MOVIE_CARDS(_document(content))
+    return [_movie(card, CARD_FIELDS) for card in cards[:top]]
+
+
+def parse_top_service(lang: str, content: bytes, top: int) -> List[FAMovie]:
+    doc = _document(content)
+    cards = TOP_MOVIE_CARDS(doc) or MOVIE_CARDS(doc)
+    return [_movie(card, TOP_CARD_FIELDS) for card in cards[:top]]
+
+
+def parse_movie(lang: str, content: bytes, mid: str) -> FAMovie:
+    doc = _document(content)
+    if not Z_MOVIE(doc):
+        return {}
+
+    return _movie(doc, DETAIL_FIELDS, id=mid)
+
+
+def _images(section) -> List[Dict[str, str]]:
+    if section is None:
+        return []
+
+    images = []
+    for cell in COLORBOX_IMAGES(section):
+        link = _first(A, cell)
+        if link is None:
+            continue
+
+        title = link.get("title") or link.get("data-bs-title") or ""
+        country = IMAGE_COUNTRY.search(title) or IMAGE_COUNTRY_DIV.search(title)
+
+        thumbnail = None
+        div = _first(DIV, link)
+        if div is not None and div.get("style"):
+            match = THUMBNAIL.search(div.get("style"))
+            if match:
+                thumbnail = match.group(1)
+
+        images.append({
+            "image": link.get("href"),
+            "thumbnail": thumbnail,
+            "country": country.group(1) if country else None,
+        })
+
+    return images
+
+
+def parse_images(content: bytes) -> Dict[str, List[Dict[str, str]]]:
+    doc = _document(content)
+    if not MAIN_IMAGE(doc):
+        return {section: [] for section in IMAGE_SECTIONS}
+
+    return {
+        section: _images(_first(IMAGE_SECTION, doc, id=section_id))
+        for section, section_id in IMAGE_SECTIONS.items()
+    }
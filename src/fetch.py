@@ -0,0 +1,236 @@
+from typing import NamedTuple, Optional
+import time
+import random
+import asyncio
+import logging
+
+import aiohttp
+from yarl import URL
+from python_filmaffinity.exceptions import FilmAffinityConnectionError
+
+from metrics import METRICS
+
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/125.0 Safari/537.36"
+)
+# status codes worth a new attempt
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpen(FilmAffinityConnectionError):
+    """
+    The request was not made because FilmAffinity is failing.
+    """
+
+
+class FetchedPage(NamedTuple):
+    # None when the page was not modified
+    body: Optional[bytes]
+    etag: Optional[str]
+    last_modified: Optional[str]
+
+
+class CircuitBreaker:
+    """
+    Stops the requests after `failures` consecutive failed ones. After
+    `reset` seconds a single trial request is let through, closing the
+    circuit if it succeeds and opening it again if not.
+    """
+
+    def __init__(self, failures: int = 5, reset: float = 30):
+        self.failures = failures
+        self.reset = reset
+        self.consecutive = 0
+        self.opens = 0
+        self.rejected = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        if self._opened_at is None:
+            return True
+        elapsed = time.monotonic() - self._opened_at
+        if not self._trial and elapsed >= self.reset:
+            self._trial = True
+            return True
+
+        self.rejected += 1
+        return False
+
+    def success(self):
+        self.consecutive = 0
+        self._opened_at = None
+        self._trial = False
+
+    def failure(self):
+        self.consecutive += 1
+        if self._trial or (
+            self._opened_at is None and self.consecutive >= self.failures
+        ):
+            if self._opened_at is None:
+                self.opens += 1
+            self._opened_at = time.monotonic()
+            self._trial = False
+
+    def abandon(self):
+        """
+        The request let through ended without success or failure.
+        """
+        self._trial = False
+
+    def stats(self) -> str:
+        state = "closed"
+        if self._opened_at is not None:
+            state = "half-open" if self._trial else "open"
+
+        return f"circuit {state}, {self.opens} opens, {self.rejected} rejected"
+
+
+class Fetcher:
+    """
+    Async HTTP client for FilmAffinity pages.
+
+    Keeps a persistent pool of keep-alive connections, bounds the concurrent
+    connections per host and retries failed requests with exponential
+    backoff. Raises FilmAffinityConnectionError when all attempts fail or
+    the page is answered with an error status not worth a retry, as the
+    sync client does, and CircuitOpen without trying while the circuit
+    breaker is open.
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 20,
+        timeout: float = 10,
+        retries: int = 2,
+        backoff: float = 0.5,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.requests = 0
+        self.failed_attempts = 0
+        self.errors = 0
+        self.not_modified = 0
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.limit,
+                    limit_per_host=self.limit_per_host,
+                    keepalive_timeout=60
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"User-Agent": USER_AGENT}
+            )
+
+        return self._session
+
+    async def get(self, url: str) -> bytes:
+        """
+        Returns the body of the page at url, url must be already quoted.
+        """
+        return (await self.fetch(url)).body
+
+    async def fetch(
+        self,
+        url: str,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None
+    ) -> FetchedPage:
+        """
+        Requests the page at url, conditionally if given the validators of
+        a previous copy, whose body is None if the page is not modified.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen(f"GET {url}: FilmAffinity is failing")
+
+        headers = {}
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        if last_modified is not None:
+            headers["If-Modified-Since"] = last_modified
+
+        try:
+            page = await self._fetch(url, headers)
+        except FilmAffinityConnectionError:
+            self.breaker.failure()
+            raise
+        except BaseException:
+            self.breaker.abandon()
+            raise
+
+        self.breaker.success()
+        return page
+
+    async def _fetch(self, url: str, headers: dict) -> FetchedPage:
+        session = self._get_session()
+        self.requests += 1
+
+        for attempt in range(self.retries + 1):
+            try:
+                with METRICS.time("fa_request_seconds"):
+                    async with session.get(
+                        URL(url, encoded=True), headers=headers
+                    ) as response:
+                        logging.debug(f"GET {url} {response.status}")
+                        if 200 <= response.status < 300:
+                            return FetchedPage(
+                                await response.read(),
+                                response.headers.get("ETag"),
+                                response.headers.get("Last-Modified")
+                            )
+                        if response.status == 304:
+                            self.not_modified += 1
+                            return FetchedPage(
+                                None,
+                                response.headers.get("ETag"),
+                                response.headers.get("Last-Modified")
+                            )
+
+                error = f"{response.status} {response.reason}"
+                METRICS.inc("fa_errors_total", error=str(response.status))
+                # the page of an error is never parsed nor cached
+                if response.status not in RETRY_STATUSES:
+                    self.failed_attempts += 1
+                    self.errors += 1
+                    raise FilmAffinityConnectionError(f"GET {url}: {error}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = repr(e)
+                METRICS.inc("fa_errors_total", error=type(e).__name__)
+
+            self.failed_attempts += 1
+            if attempt < self.retries:
+                await asyncio.sleep(
+                    self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+                )
+
+        self.errors += 1
+        raise FilmAffinityConnectionError(f"GET {url}: {error}")
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the fetcher counters.
+        """
+        return (
+            f"{self.requests} requests, {self.not_modified} not modified, "
+            f"{self.failed_attempts} failed attempts, {self.errors} errors, "
+            f"{self.breaker.stats()}"
+        )
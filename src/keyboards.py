@@ -65,6 +65,18 @@ def movie_keyboard(
     ]
 
 
+def gallery(_: Callable, mid: str, offset: int) -> Keyboard:
+    """
+    Keyboard for the next page of images of a movie.
+    """
+    data = f"images_{mid}_{offset}".encode("utf8")
+
+    return [
+        [Button.inline(f"🖼 {_('More images')}", data)],
+        hide(_)
+    ]
+
+
 def select_lang() -> Keyboard:
     """
     Select language keyboard.
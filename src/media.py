@@ -0,0 +1,160 @@
+from typing import List, Optional, Union
+import logging
+
+import aiosqlite
+from telethon.tl.custom import Message
+from telethon.tl.types import InputPhoto
+from telethon.errors.rpcerrorlist import FileReferenceEmptyError, \
+    FileReferenceExpiredError, FileReferenceInvalidError, MediaEmptyError
+
+from bot_types import CallbackMessageEventLike
+from caches import TTLCache
+from db_writer import DBWriter
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    url             TEXT        PRIMARY KEY     NOT NULL,
+    photo_id        INT64       NOT NULL,
+    access_hash     INT64       NOT NULL,
+    file_reference  BLOB        NOT NULL
+);
+"""
+# errors of a stored reference that Telegram doesn't accept anymore
+REFERENCE_ERRORS = (
+    FileReferenceEmptyError,
+    FileReferenceExpiredError,
+    FileReferenceInvalidError,
+    MediaEmptyError
+)
+
+
+class MediaCache:
+    """
+    Maps the URLs of the images sent by the bot to the photos uploaded to
+    Telegram, so the next sends reuse the photo instead of making Telegram
+    download the image again.
+
+    The references are saved in the DB through `writer` and the most used
+    are also kept in memory.
+    """
+
+    def __init__(self, writer: DBWriter, memory_size: int = 10_000):
+        self.writer = writer
+        self.db_conn: Optional[aiosqlite.Connection] = None
+        self.memory = TTLCache(maxsize=memory_size)
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def setup(self, db_conn: aiosqlite.Connection):
+        self.db_conn = db_conn
+        await db_conn.executescript(SCHEMA)
+        await db_conn.commit()
+
+    async def get(self, url: str) -> Optional[InputPhoto]:
+        return (await self.get_many([url]))[0]
+
+    async def get_many(self, urls: List[str]) -> List[Optional[InputPhoto]]:
+        """
+        Returns the photos of the URLs, None for the ones not cached, with a
+        single DB query for the ones not in memory.
+        """
+        photos = {url: self.memory.get(url) for url in urls}
+        missing = [url for url, photo in photos.items() if photo is None]
+
+        if missing:
+            async with self.db_conn.execute(
+                "SELECT url, photo_id, access_hash, file_reference FROM media "
+                f"WHERE url IN ({', '.join('?' * len(missing))})",
+                missing
+            ) as cursor:
+                rows = await cursor.fetchall()
+
+            for url, *row in rows:
+                photos[url] = InputPhoto(*row)
+                self.memory.set(url, photos[url])
+
+        result = [photos[url] for url in urls]
+        for photo in result:
+            if photo is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        return result
+
+    def save(self, url: str, message: Message):
+        """
+        Saves the reference of the photo of a message sent with url, it is
+        written to the DB in the next flush of the writer.
+        """
+        if message is None or message.photo is None:
+            return
+
+        photo = InputPhoto(
+            id=message.photo.id,
+            access_hash=message.photo.access_hash,
+            file_reference=message.photo.file_reference
+        )
+        self.memory.set(url, photo)
+        self.writer.write(
+            "INSERT OR REPLACE INTO media "
+            "(url, photo_id, access_hash, file_reference) VALUES (?, ?, ?, ?)",
+            (url, photo.id, photo.access_hash, photo.file_reference, )
+        )
+
+    def invalidate(self, url: str):
+        self.invalidations += 1
+        self.memory.pop(url)
+        self.writer.write("DELETE FROM media WHERE url = ?", (url, ))
+
+    async def respond(
+        self,
+        event: CallbackMessageEventLike,
+        file: Union[str, List[str]],
+        **kwargs
+    ) -> Union[Message, List[Message]]:
+        """
+        event.respond() with the image or images at the URLs in file, sent
+        from the cached references when available.
+        """
+        urls = file if isinstance(file, list) else [file]
+        photos = await self.get_many(urls)
+        files = [photo or url for photo, url in zip(photos, urls)]
+
+        try:
+            result = await event.respond(
+                file=files if isinstance(file, list) else files[0],
+                **kwargs
+            )
+        except REFERENCE_ERRORS as e:
+            if not any(photos):
+                raise
+
+            logging.info(f"Invalidating media references: {e}")
+            for photo, url in zip(photos, urls):
+                if photo is not None:
+                    self.invalidate(url)
+            photos = [None] * len(urls)
+
+            result = await event.respond(file=file, **kwargs)
+
+        messages = result if isinstance(result, list) else [result]
+        for photo, url, message in zip(photos, urls, messages):
+            if photo is None:
+                self.save(url, message)
+
+        return result
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the cache counters.
+        """
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0.0
+
+        return (
+            f"{self.hits} hits, {self.misses} misses ({ratio:.0%}), "
+            f"{self.invalidations} invalidations"
+        )
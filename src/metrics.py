@@ -0,0 +1,225 @@
+from typing import Callable, Dict, Optional, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+import time
+import bisect
+
+from aiohttp import web
+from telethon.events import StopPropagation
+
+
+# upper bounds in seconds of the histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# handler being run in the current task, used to label the stages
+current_handler: ContextVar[str] = ContextVar("current_handler", default="-")
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Approximated quantile, interpolated inside its bucket.
+        """
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else lower * 2
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+
+        return self.buckets[-1]
+
+
+def _key(**labels: str) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    pairs = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metrics:
+    """
+    Registry of the runtime metrics of the bot: histograms, counters and
+    gauges, all of them with optional labels.
+
+    Shown to the admin in /stats and exposed in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def observe(self, name: str, value: float, **labels: str):
+        series = self.histograms.setdefault(name, {})
+        key = _key(**labels)
+        if key not in series:
+            series[key] = Histogram()
+
+        series[key].observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        series = self.counters.setdefault(name, {})
+        key = _key(**labels)
+        series[key] = series.get(key, 0) + value
+
+    def gauge(self, name: str, func: Callable[[], float]):
+        self.gauges[name] = func
+
+    @contextmanager
+    def time(self, name: str, **labels: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def stage(self, stage: str):
+        """
+        Times a stage (fa, render, send) of the handler being run.
+        """
+        return self.time(
+            "stage_seconds", handler=current_handler.get(), stage=stage
+        )
+
+    def handler(self, func: Callable, **labels: str) -> Callable:
+        """
+        Wraps an event handler timing it and counting the exceptions it
+        raises by type.
+        """
+        name = func.__name__
+        # looked up once, the wrapper runs for every update
+        series = self.histograms.setdefault("handler_seconds", {})
+        histogram = series.setdefault(_key(handler=name, **labels), Histogram())
+
+        @wraps(func)
+        async def wrapper(event):
+            token = current_handler.set(name)
+            start = time.perf_counter()
+            try:
+                return await func(event)
+            except StopPropagation:
+                raise
+            except Exception as e:
+                self.inc(
+                    "handler_errors_total",
+                    handler=name,
+                    error=type(e).__name__,
+                    **labels
+                )
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - start)
+                current_handler.reset(token)
+
+        return wrapper
+
+    def render_prometheus(self) -> str:
+        """
+        All the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+
+        for name, series in self.histograms.items():
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    le = _format_labels(labels, f'le="{bound}"')
+                    lines.append(f"{name}_bucket{le} {cumulative}")
+                le = _format_labels(labels, 'le="+Inf"')
+                lines.append(f"{name}_bucket{le} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+        for name, series in self.counters.items():
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name, func in self.gauges.items():
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {func()}")
+
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """
+        Human readable summary of the latencies, errors and gauges.
+        """
+        lines = []
+
+        for name, series in self.histograms.items():
+            lines.append(f"{name}:")
+            for labels, histogram in sorted(series.items()):
+                if not histogram.count:
+                    continue
+                label = "/".join(value for _, value in labels)
+                lines.append(
+                    f"  {label}: {histogram.count} × "
+                    f"p50 {histogram.quantile(0.5) * 1000:.0f}ms "
+                    f"p95 {histogram.quantile(0.95) * 1000:.0f}ms"
+                )
+
+        for name, series in self.counters.items():
+            for labels, count in sorted(series.items()):
+                label = "/".join(value for _, value in labels)
+                lines.append(f"{name} {label}: {count:.0f}")
+
+        for name, func in self.gauges.items():
+            lines.append(f"{name}: {func()}")
+
+        return "\n".join(lines)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.render_prometheus(),
+            content_type="text/plain",
+            charset="utf-8"
+        )
+
+    async def serve(self, host: str, port: int):
+        """
+        Starts the HTTP endpoint with the metrics at /metrics.
+        """
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+METRICS = Metrics()
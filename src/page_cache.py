@@ -0,0 +1,428 @@
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+import time
+import zlib
+import asyncio
+import logging
+import sqlite3
+import threading
+
+import aiosqlite
+
+
+# kind of page -> default seconds it is cached
+TTLS = {
+    "search": 60 * 60,
+    "top": 60 * 60,
+    "movie": 24 * 60 * 60,
+    "images": 7 * 24 * 60 * 60,
+}
+# seconds the expired pages are kept to be served while revalidated
+STALE = 7 * 24 * 60 * 60
+# eviction policy -> order of the pages to evict first
+EVICTION_ORDER = {
+    "lru": "used",
+    "lfu": "uses, used",
+}
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS page (
+    url         TEXT        PRIMARY KEY     NOT NULL,
+    kind        TEXT                        NOT NULL,
+    body        BLOB                        NOT NULL,
+    raw_size    INT64                       NOT NULL,
+    expires     REAL                        NOT NULL,
+    used        REAL                        NOT NULL,
+    uses        INT64       DEFAULT 0       NOT NULL,
+    etag        TEXT,
+    modified    TEXT
+);
+CREATE INDEX IF NOT EXISTS page_expires ON page (expires);
+CREATE INDEX IF NOT EXISTS page_used ON page (used);
+CREATE INDEX IF NOT EXISTS page_uses ON page (uses, used);
+"""
+# page at url not expired for longer than the stale time
+READ = (
+    "SELECT body, expires, etag, modified FROM page "
+    "WHERE url = ? AND expires > ?"
+)
+# columns added after the first version of the table
+NEW_COLUMNS = {
+    "etag": "TEXT",
+    "modified": "TEXT",
+}
+
+
+class CachedPage(NamedTuple):
+    content: bytes
+    # False once the TTL is over, the page should be revalidated
+    fresh: bool
+    # validators of the page for conditional requests
+    etag: Optional[str]
+    modified: Optional[str]
+
+
+class PageCache:
+    """
+    Persistent cache of the FilmAffinity pages, in its own sqlite DB.
+
+    The pages are stored compressed with zlib and expire after the TTL of
+    their kind, the expired ones are still returned by lookup() as stale
+    for `stale` seconds more. When the compressed pages exceed `max_bytes`
+    the least recently (lru) or least frequently (lfu) used are evicted. A
+    background task deletes the pages past the stale time and returns the
+    free pages of the DB file to the system with incremental vacuums.
+
+    The DB is in WAL mode, so the pages are read concurrently by a pool of
+    `readers` threads, each with its own connection, while all the writes
+    go through the single connection of the writer. With no readers the
+    pages are read by the writer connection too.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_bytes: int,
+        ttls: Optional[Dict[str, float]] = None,
+        eviction: str = "lru",
+        level: int = 6,
+        interval: float = 60,
+        vacuum_pages: int = 1024,
+        readers: int = 4,
+        stale: float = STALE
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(TTLS, **(ttls or {}))
+        self.eviction_order = EVICTION_ORDER[eviction]
+        self.level = level
+        self.interval = interval
+        self.vacuum_pages = vacuum_pages
+        self.readers = readers
+        self.stale = stale
+        self.db_conn: Optional[aiosqlite.Connection] = None
+        self._reader_pool: Optional[ThreadPoolExecutor] = None
+        # connection of each reader thread
+        self._local = threading.local()
+        self._reader_conns: List[sqlite3.Connection] = []
+        self.entries = 0
+        self.size = 0
+        self.raw_size = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.errors = 0
+        # url -> (last use, uses) not yet written to the DB
+        self._uses: Dict[str, Tuple[float, int]] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def setup(self):
+        self.db_conn = db_conn = await aiosqlite.connect(self.path)
+
+        async with db_conn.execute("PRAGMA auto_vacuum") as cursor:
+            auto_vacuum = (await cursor.fetchone())[0]
+        # 2 is incremental, enabling it in an existing DB needs a vacuum
+        if auto_vacuum != 2:
+            await db_conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await db_conn.execute("VACUUM")
+
+        await db_conn.execute("PRAGMA journal_mode = WAL")
+        await db_conn.execute("PRAGMA synchronous = NORMAL")
+        await db_conn.executescript(SCHEMA)
+        async with db_conn.execute("PRAGMA table_info(page)") as cursor:
+            columns = {row[1] async for row in cursor}
+        for column, column_type in NEW_COLUMNS.items():
+            if column not in columns:
+                await db_conn.execute(
+                    f"ALTER TABLE page ADD COLUMN {column} {column_type}"
+                )
+        await db_conn.commit()
+
+        async with db_conn.execute(
+            "SELECT COUNT(), TOTAL(length(body)), TOTAL(raw_size) FROM page"
+        ) as cursor:
+            count, size, raw_size = await cursor.fetchone()
+        self.entries, self.size, self.raw_size = count, int(size), int(raw_size)
+
+        if self.readers:
+            self._reader_pool = ThreadPoolExecutor(
+                self.readers, thread_name_prefix="page-cache"
+            )
+
+    def _reader_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # only used by this thread, closed by stop() once it is finished
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA query_only = ON")
+            self._local.conn = conn
+            self._reader_conns.append(conn)
+
+        return conn
+
+    def _read(self, url: str, now: float) -> Optional[CachedPage]:
+        # fetchall() ends the read transaction, a read left open would
+        # block the checkpoints of the WAL
+        rows = self._reader_conn().execute(
+            READ, (url, now - self.stale)
+        ).fetchall()
+
+        return self._page(rows[0], now) if rows else None
+
+    @staticmethod
+    def _page(row: tuple, now: float) -> CachedPage:
+        body, expires, etag, modified = row
+        return CachedPage(zlib.decompress(body), expires > now, etag, modified)
+
+    async def _read_writer_conn(
+        self,
+        url: str,
+        now: float
+    ) -> Optional[CachedPage]:
+        async with self.db_conn.execute(
+            READ, (url, now - self.stale)
+        ) as cursor:
+            row = await cursor.fetchone()
+
+        if row is None:
+            return None
+
+        return await asyncio.get_event_loop().run_in_executor(
+            None, self._page, row, now
+        )
+
+    async def lookup(self, url: str) -> Optional[CachedPage]:
+        """
+        Returns the cached page at url, fresh or stale, None if missing.
+        """
+        now = time.time()
+        try:
+            if self._reader_pool is not None:
+                page = await asyncio.get_event_loop().run_in_executor(
+                    self._reader_pool, self._read, url, now
+                )
+            else:
+                page = await self._read_writer_conn(url, now)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logging.error(f"Page cache read of {url} failed: {e}")
+            page = None
+
+        if page is None:
+            self.misses += 1
+            return None
+
+        if page.fresh:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        _, uses = self._uses.get(url, (now, 0))
+        self._uses[url] = (now, uses + 1)
+
+        return page
+
+    async def get(self, url: str) -> Optional[bytes]:
+        """
+        Returns the cached page at url, None if missing or expired.
+        """
+        page = await self.lookup(url)
+
+        return page.content if page is not None and page.fresh else None
+
+    async def set(
+        self,
+        url: str,
+        kind: str,
+        content: bytes,
+        etag: Optional[str] = None,
+        modified: Optional[str] = None
+    ):
+        """
+        Caches the page at url for the TTL of its kind, with the validators
+        of the response.
+        """
+        body = await asyncio.get_event_loop().run_in_executor(
+            None, zlib.compress, content, self.level
+        )
+        if len(body) > self.max_bytes:
+            return
+
+        try:
+            await self._insert(url, kind, content, body, etag, modified)
+        except sqlite3.Error as e:
+            self.errors += 1
+            logging.error(f"Page cache write of {url} failed: {e}")
+
+    async def _insert(
+        self,
+        url: str,
+        kind: str,
+        content: bytes,
+        body: bytes,
+        etag: Optional[str],
+        modified: Optional[str]
+    ):
+        now = time.time()
+        async with self._lock:
+            await self._delete("url = ?", (url, ))
+            await self.db_conn.execute(
+                "INSERT INTO page "
+                "(url, kind, body, raw_size, expires, used, etag, modified) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    url, kind, body, len(content), now + self.ttls[kind], now,
+                    etag, modified
+                )
+            )
+            self.entries += 1
+            self.size += len(body)
+            self.raw_size += len(content)
+
+            if self.size > self.max_bytes:
+                await self._evict(url)
+            await self.db_conn.commit()
+
+    async def refresh(self, url: str, kind: str):
+        """
+        Renews the TTL of the page at url, not modified since cached.
+        """
+        try:
+            async with self._lock:
+                await self.db_conn.execute(
+                    "UPDATE page SET expires = ? WHERE url = ?",
+                    (time.time() + self.ttls[kind], url)
+                )
+                await self.db_conn.commit()
+            self.refreshes += 1
+        except sqlite3.Error as e:
+            self.errors += 1
+            logging.error(f"Page cache refresh of {url} failed: {e}")
+
+    async def _delete(self, where: str, parameters=()) -> int:
+        """
+        Deletes the pages matching where, keeping the sizes up to date.
+        """
+        async with self.db_conn.execute(
+            "SELECT COUNT(), TOTAL(length(body)), TOTAL(raw_size) FROM page "
+            f"WHERE {where}",
+            parameters
+        ) as cursor:
+            count, size, raw_size = await cursor.fetchone()
+
+        if count:
+            await self.db_conn.execute(
+                f"DELETE FROM page WHERE {where}", parameters
+            )
+            self.entries -= count
+            self.size -= int(size)
+            self.raw_size -= int(raw_size)
+
+        return count
+
+    async def _flush_uses(self):
+        uses, self._uses = self._uses, {}
+        await self.db_conn.executemany(
+            "UPDATE page SET used = MAX(used, ?), uses = uses + ? "
+            "WHERE url = ?",
+            ((used, count, url) for url, (used, count) in uses.items())
+        )
+
+    async def _evict(self, keep: str):
+        await self._flush_uses()
+
+        # evicts down to 15/16 of the cap, so the next pages fit without
+        # evicting again, but never the page just cached
+        excess = self.size - self.max_bytes * 15 // 16
+        victims = []
+        async with self.db_conn.execute(
+            "SELECT url, length(body), raw_size FROM page WHERE url != ? "
+            f"ORDER BY {self.eviction_order}",
+            (keep, )
+        ) as cursor:
+            async for url, size, raw_size in cursor:
+                victims.append((url, ))
+                excess -= size
+                self.size -= size
+                self.raw_size -= raw_size
+                if excess <= 0:
+                    break
+
+        await self.db_conn.executemany(
+            "DELETE FROM page WHERE url = ?", victims
+        )
+        self.entries -= len(victims)
+        self.evictions += len(victims)
+
+    async def maintain(self):
+        """
+        Writes the uses of the pages, deletes the ones expired for longer
+        than the stale time and vacuums part of the free pages of the DB.
+        """
+        async with self._lock:
+            await self._flush_uses()
+            self.expirations += await self._delete(
+                "expires <= ?", (time.time() - self.stale, )
+            )
+            await self.db_conn.commit()
+            # the pragma frees a page per step and execute() only steps
+            # once, executescript() runs it to the end
+            await self.db_conn.executescript(
+                f"PRAGMA incremental_vacuum({self.vacuum_pages});"
+            )
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.shield(self.maintain())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Page cache maintenance failed: {e!r}")
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+        if self._reader_pool is not None:
+            self._reader_pool.shutdown()
+            for conn in self._reader_conns:
+                conn.close()
+            self._reader_conns.clear()
+
+        async with self._lock:
+            await self._flush_uses()
+            await self.db_conn.commit()
+        await self.db_conn.close()
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the cache counters.
+        """
+        size = round(self.size / 1024 / 1024, 2)
+        raw_size = round(self.raw_size / 1024 / 1024, 2)
+        max_size = round(self.max_bytes / 1024 / 1024, 2)
+
+        return (
+            f"{self.entries} pages, {size}/{max_size} MB "
+            f"({raw_size} MB uncompressed), {self.hits} hits, "
+            f"{self.misses} misses ({self.hit_ratio:.0%}), "
+            f"{self.stale_hits} stale, {self.refreshes} revalidated, "
+            f"{self.evictions} evictions, {self.expirations} expired, "
+            f"{self.errors} errors"
+        )
@@ -0,0 +1,134 @@
+from typing import Callable, Dict, List, Set, Tuple
+import time
+import asyncio
+import logging
+
+from bot_types import FAMovie
+from fa_async import AsyncFilmAffinity
+from metrics import METRICS
+from repository import MovieRepository
+from scheduler import current_priority
+
+
+class Prefetcher:
+    """
+    Fetches in background the details of the first `top` results of a
+    search, so the movie tapped next is already cached.
+
+    At most `budget` prefetches run at once, the rest are skipped, and none
+    is started while `overloaded()` is true, which also cancels the running
+    ones. A prefetched movie not opened within `window` seconds is counted
+    as wasted.
+    """
+
+    def __init__(
+        self,
+        movies: MovieRepository,
+        top: int = 3,
+        budget: int = 8,
+        window: float = 10 * 60,
+        overloaded: Callable[[], bool] = lambda: False
+    ):
+        self.movies = movies
+        self.top = top
+        self.budget = budget
+        self.window = window
+        self.overloaded = overloaded
+        self.started = 0
+        self.skipped = 0
+        self.cancelled = 0
+        self.failed = 0
+        self.hits = 0
+        self.wasted = 0
+        self._tasks: Set[asyncio.Task] = set()
+        # (lang, id) -> time prefetched, in insertion order
+        self._prefetched: Dict[Tuple[str, str], float] = {}
+
+    def schedule(self, fa: AsyncFilmAffinity, result: List[FAMovie]):
+        """
+        Starts the prefetch of the first results of a search not cached yet.
+        """
+        self._expire()
+        if self.overloaded():
+            self.shed()
+            return
+
+        for movie in result[:self.top]:
+            key = (fa.lang, str(movie["id"]))
+            if key in self._prefetched or key in self.movies.cache:
+                continue
+            if len(self._tasks) >= self.budget:
+                self.skipped += 1
+                METRICS.inc("prefetch_total", result="skipped")
+                continue
+
+            self.started += 1
+            METRICS.inc("prefetch_total", result="started")
+            self._prefetched[key] = time.monotonic()
+            task = asyncio.ensure_future(self._fetch(fa, key[1]))
+            self._tasks.add(task)
+            task.add_done_callback(
+                lambda task, key=key: self._done(task, key)
+            )
+
+    def _done(self, task: asyncio.Task, key: Tuple[str, str]):
+        self._tasks.discard(task)
+        # a cancelled prefetch is neither a hit nor wasted
+        if task.cancelled():
+            self._prefetched.pop(key, None)
+
+    async def _fetch(self, fa: AsyncFilmAffinity, mid: str):
+        # lets the handler that scheduled it finish first
+        await asyncio.sleep(0)
+        current_priority.set("background")
+        try:
+            await self.movies.get(fa, mid)
+        except Exception as e:
+            self.failed += 1
+            self._prefetched.pop((fa.lang, mid), None)
+            logging.info(f"Prefetch of movie {mid} failed: {e!r}")
+
+    def shed(self):
+        """
+        Cancels the running prefetches, the users waiting for the same
+        movies keep their fetches.
+        """
+        for task in list(self._tasks):
+            if task.cancel():
+                self.cancelled += 1
+                METRICS.inc("prefetch_total", result="cancelled")
+
+    def claim(self, lang: str, mid: str):
+        """
+        Counts the opening of a movie as a hit if it was prefetched.
+        """
+        if self._prefetched.pop((lang, mid), None) is not None:
+            self.hits += 1
+            METRICS.inc("prefetch_total", result="hit")
+
+    def _expire(self):
+        deadline = time.monotonic() - self.window
+        while self._prefetched:
+            key, prefetched = next(iter(self._prefetched.items()))
+            if prefetched > deadline:
+                break
+
+            del self._prefetched[key]
+            self.wasted += 1
+            METRICS.inc("prefetch_total", result="wasted")
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.wasted
+        return self.hits / total if total else 0.0
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the prefetcher counters.
+        """
+        return (
+            f"{self.started} started, {self.hits} hits, {self.wasted} wasted "
+            f"({self.hit_ratio:.0%}), {self.skipped} skipped, "
+            f"{self.cancelled} cancelled, {self.failed} failed, "
+            f"{len(self._tasks)} running"
+        )
@@ -0,0 +1,100 @@
+from typing import Callable, Hashable
+
+from bot_types import FAMovie
+from caches import TTLCache
+from utils import humanize
+
+
+def render_movie(_: Callable, lang: str, movie: FAMovie) -> str:
+    return _("movie_template").format(**humanize(movie))
+
+
+def render_synopsis(_: Callable, lang: str, movie: FAMovie) -> str:
+    return (
+        f"ℹ **{_('Synopsis')}: "
+        "{title}** ℹ\n\n{description}".format(**movie)
+    )
+
+
+def render_awards(_: Callable, lang: str, movie: FAMovie) -> str:
+    awards_text = f"🏆 **{_('Awards')}: {movie['title']}** 🏆\n\n"
+    final = ""
+
+    for a in movie["awards"]:
+        if a["year"].isalnum():
+            awards_text += f"🔸 `{a['year']}`: {a['award']}\n"
+        else:
+            final = f"↗ {a['year']}"
+
+    awards_text += (
+        f"\n[{final if final else _('see_at_fa')}]"
+        f"(https://www.filmaffinity.com/{lang}/film{movie['id']}.html)"
+    )
+
+    return awards_text
+
+
+def render_reviews(_: Callable, lang: str, movie: FAMovie) -> str:
+    mid = movie["id"]
+    reviews_text = f"💭 **{_('Reviews')}: {movie['title']}** 💭\n"
+
+    for r in movie["reviews"]:
+        # remove `[` and `]` for don't break telegram markdown
+        actual_review = r["review"].replace("[", "")
+        actual_review = actual_review.replace("]", "")
+        reviews_text += (
+            f"\n👤 [{r['author']}]"
+            f"({r['url'] or f'www.filmaffinity.com/{lang}/film{mid}.html'})\n"
+            f"💭 __{actual_review}__\n"
+        )
+
+    reviews_text += (
+        f"\n[{_('see_at_fa')}]"
+        f"(www.filmaffinity.com/{lang}/pro-reviews.php?movie-id={mid})"
+    )
+
+    return reviews_text
+
+
+# section of a movie -> function rendering its message
+RENDERERS = {
+    "movie": render_movie,
+    "synopsis": render_synopsis,
+    "awards": render_awards,
+    "reviews": render_reviews,
+}
+
+
+class RenderCache:
+    """
+    Rendered message bodies of the movie sections, keyed by
+    (lang, movie id, section).
+
+    The ads are not part of the bodies, they are added on every send. The
+    bodies of a movie must be invalidated when its data is refreshed.
+    """
+
+    def __init__(self, cache: TTLCache):
+        self.cache = cache
+        self.invalidations = 0
+
+    def get(self, _: Callable, lang: str, movie: FAMovie, section: str) -> str:
+        key = (lang, movie["id"], section)
+
+        text = self.cache.get(key)
+        if text is None:
+            text = RENDERERS[section](_, lang, movie)
+            self.cache.set(key, text)
+
+        return text
+
+    def invalidate(self, lang: str, mid: Hashable):
+        self.invalidations += 1
+        for section in RENDERERS:
+            self.cache.pop((lang, mid, section))
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the cache counters.
+        """
+        return f"{self.cache.stats()}, {self.invalidations} invalidations"
@@ -0,0 +1,208 @@
+from typing import Dict, Hashable, List, Callable, Awaitable, Any, Optional
+import asyncio
+import unicodedata
+
+from bot_types import FAMovie
+from caches import TTLCache
+from fa_async import AsyncFilmAffinity
+from scheduler import UpstreamScheduler
+
+
+def normalize_query(text: str) -> str:
+    """
+    Folds case, accents and whitespace of a search query.
+    """
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+
+    return " ".join(text.casefold().split())
+
+
+class Repository:
+    """
+    Base of the repositories of FilmAffinity data, keeps the data in a
+    LRU/TTL cache and makes concurrent requests for the same key await a
+    single fetch, whose request to FilmAffinity is promoted to the most
+    urgent priority of its waiters when there is a scheduler.
+    """
+
+    def __init__(
+        self,
+        cache: TTLCache,
+        scheduler: Optional[UpstreamScheduler] = None
+    ):
+        self.cache = cache
+        self.scheduler = scheduler
+        self.fetches = 0
+        self.coalesced = 0
+        # key -> [fetch future, number of waiters]
+        self._in_flight: Dict[Hashable, list] = {}
+
+    async def _single_flight(
+        self,
+        key: Hashable,
+        func: Callable[..., Awaitable],
+        *args
+    ) -> Any:
+        flight = self._in_flight.get(key)
+        if flight is None:
+            flight = [asyncio.ensure_future(func(*args)), 0]
+            self._in_flight[key] = flight
+            flight[0].add_done_callback(
+                lambda _: self._in_flight.pop(key, None)
+            )
+        else:
+            self.coalesced += 1
+            if self.scheduler is not None:
+                self.scheduler.promote(flight[0])
+
+        future = flight[0]
+        flight[1] += 1
+        try:
+            # a waiter being cancelled must not cancel the fetch of the others
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # unless it was the last one waiting for it
+            if flight[1] == 1:
+                future.cancel()
+            raise
+        finally:
+            flight[1] -= 1
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the repository counters.
+        """
+        memory = round(self.cache.memory_usage() / 1024 / 1024, 2)
+
+        return (
+            f"{self.cache.stats()}, {memory} MB, "
+            f"{self.fetches} fetches, {self.coalesced} coalesced"
+        )
+
+
+class MovieRepository(Repository):
+    """
+    Movie details shared by all the handlers, keyed by (lang, id).
+    """
+
+    def __init__(
+        self,
+        cache: TTLCache,
+        scheduler: Optional[UpstreamScheduler] = None
+    ):
+        super().__init__(cache, scheduler)
+        # called with (lang, id) when the data of a movie is refreshed
+        self.on_refresh: List[Callable[[str, str], Any]] = []
+
+    async def get(
+        self,
+        fa: AsyncFilmAffinity,
+        mid: str,
+        images: bool = False
+    ) -> FAMovie:
+        """
+        Returns the movie with id mid, optionally with its images.
+
+        The returned dict is shared, callers must not modify it.
+        """
+        movie = self.cache.get((fa.lang, mid), count=False)
+        if movie is not None and (not images or "images" in movie):
+            self.cache.hits += 1
+            return movie
+
+        self.cache.misses += 1
+
+        return await self._single_flight(
+            (fa.lang, mid, images), self._fetch, fa, mid, images
+        )
+
+    async def _fetch(self, fa: AsyncFilmAffinity, mid: str, images: bool) -> FAMovie:
+        self.fetches += 1
+        movie = await fa.get_movie(mid, images=images)
+
+        # don't replace a cached copy that includes the images with one that not
+        cached = self.cache.get((fa.lang, mid), count=False)
+        if movie and (images or cached is None or "images" not in cached):
+            self.cache.set((fa.lang, mid), movie)
+            for callback in self.on_refresh:
+                callback(fa.lang, mid)
+
+        return movie
+
+
+class SearchRepository(Repository):
+    """
+    Search results shared by the search handlers, keyed by
+    (lang, field, normalized query, top).
+    """
+
+    async def search(
+        self,
+        fa: AsyncFilmAffinity,
+        top: int,
+        **query: str
+    ) -> List[FAMovie]:
+        """
+        Returns the results of searching by one field: title, cast or
+        director.
+
+        The returned movies are shared, callers must not modify them.
+        """
+        ((field, text), ) = query.items()
+        key = (fa.lang, field, normalize_query(text), top)
+
+        result = self.cache.get(key)
+        if result is not None:
+            return result
+
+        return await self._single_flight(key, self._fetch, fa, key, top, query)
+
+    async def _fetch(
+        self,
+        fa: AsyncFilmAffinity,
+        key: Hashable,
+        top: int,
+        query: Dict[str, str]
+    ) -> List[FAMovie]:
+        self.fetches += 1
+        result = await fa.search(top, **query)
+        self.cache.set(key, result)
+
+        return result
+
+
+class StillRepository(Repository):
+    """
+    URLs of the stills of the movies shown in the galleries, keyed by
+    (lang, id). Only the images page is fetched, not the details.
+    """
+
+    async def get(self, fa: AsyncFilmAffinity, mid: str) -> List[str]:
+        """
+        Returns the stills of the movie with id mid.
+
+        The returned list is shared, callers must not modify it.
+        """
+        key = (fa.lang, mid)
+
+        stills = self.cache.get(key)
+        if stills is not None:
+            return stills
+
+        return await self._single_flight(key, self._fetch, fa, key, mid)
+
+    async def _fetch(
+        self,
+        fa: AsyncFilmAffinity,
+        key: Hashable,
+        mid: str
+    ) -> List[str]:
+        self.fetches += 1
+        images = await fa.get_images(mid)
+        stills = [
+            still["image"] for still in images["stills"] if still["image"]
+        ]
+        self.cache.set(key, stills)
+
+        return stills
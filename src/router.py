@@ -0,0 +1,149 @@
+from typing import AnyStr, Callable, Dict, List, Optional, Pattern
+import re
+import logging
+
+from telethon.events import StopPropagation
+
+from metrics import METRICS
+
+
+# literal prefix of a command or a callback data, used as key of the routes
+MESSAGE_KEY = re.compile(r"/[A-Za-z0-9]*")
+CALLBACK_KEY = re.compile(rb"[A-Za-z0-9]*")
+
+
+class Route:
+    """
+    Handler of the events whose text or data match pattern.
+    """
+
+    def __init__(
+        self,
+        handler: Callable,
+        pattern: Optional[Pattern],
+        filter: Optional[Callable] = None
+    ):
+        self.handler = handler
+        self.pattern = pattern
+        self.filter = filter
+
+
+class Router:
+    """
+    Dispatches the events of a type to the handlers of the bot.
+
+    The hooks run for every event. Then the routes are looked up in a table
+    by the literal prefix of their pattern (the command or the callback data
+    prefix), so only the patterns sharing the prefix of the event are
+    evaluated. As with the Telethon handlers, the matching routes run in
+    registration order until one raises StopPropagation, and the exceptions
+    of a handler are logged without stopping the chain.
+    """
+
+    def __init__(self):
+        self.hooks: List[Callable] = []
+        self.routes: Dict[AnyStr, List[Route]] = {}
+
+    def subject(self, event) -> AnyStr:
+        """
+        Text or data of the event matched against the patterns.
+        """
+        raise NotImplementedError
+
+    def key(self, subject: AnyStr) -> AnyStr:
+        raise NotImplementedError
+
+    def hook(self, func: Callable) -> Callable:
+        self.hooks.append(METRICS.handler(func))
+        return func
+
+    def route(
+        self,
+        pattern: Optional[AnyStr] = None,
+        filter: Optional[Callable] = None
+    ) -> Callable:
+        """
+        Decorator adding a route to the handler. The pattern must begin with
+        the literal command or callback data prefix it handles.
+        """
+        key = self.key(pattern)
+        compiled = re.compile(pattern) if pattern is not None else None
+
+        def decorator(func: Callable) -> Callable:
+            label = key.decode("utf8") if isinstance(key, bytes) else key
+            handler = METRICS.handler(func, route=label or "-")
+            self.routes.setdefault(key, []).append(
+                Route(handler, compiled, filter)
+            )
+            return func
+
+        return decorator
+
+    async def _call(self, handler: Callable, event):
+        try:
+            await handler(event)
+        except StopPropagation:
+            raise
+        except Exception:
+            logging.exception(f"Unhandled exception on {handler.__name__}")
+
+    async def dispatch(self, event):
+        subject = self.subject(event)
+
+        try:
+            for hook in self.hooks:
+                await self._call(hook, event)
+
+            for route in self.routes.get(self.key(subject), ()):
+                if route.pattern is not None:
+                    match = route.pattern.match(subject)
+                    if not match:
+                        continue
+                else:
+                    match = None
+
+                if route.filter is not None and not route.filter(event):
+                    continue
+
+                event.pattern_match = match
+                await self._call(route.handler, event)
+        except StopPropagation:
+            pass
+
+
+class MessageRouter(Router):
+    """
+    Routes the new messages by command, the text not being a command goes
+    to the routes with a pattern not starting with /.
+    """
+
+    def subject(self, event) -> str:
+        return event.message.message or ""
+
+    def key(self, subject: Optional[str]) -> str:
+        match = MESSAGE_KEY.match(subject or "")
+        return match.group() if match else ""
+
+
+class CallbackRouter(Router):
+    """
+    Routes the callback queries by the prefix of their data.
+    """
+
+    def subject(self, event) -> bytes:
+        return event.data or b""
+
+    def key(self, subject: Optional[bytes]) -> bytes:
+        return CALLBACK_KEY.match(subject or b"").group()
+
+
+class InlineRouter(Router):
+    """
+    Routes the inline queries, all of them have the same key.
+    """
+
+    def subject(self, event) -> str:
+        return event.text
+
+    def key(self, subject: Optional[str]) -> str:
+        return ""
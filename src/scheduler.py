@@ -0,0 +1,215 @@
+from typing import Deque, Dict, Optional
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+import time
+import asyncio
+
+from python_filmaffinity.exceptions import FilmAffinityConnectionError
+
+from metrics import METRICS
+
+
+# classes of the requests to FilmAffinity, from the most to the least urgent
+PRIORITIES = ("tap", "search", "inline", "background")
+# priority -> default max seconds a request waits for a slot
+MAX_WAIT = {
+    "tap": 5,
+    "search": 3,
+    "inline": 1,
+    "background": 30,
+}
+# priority and user of the requests made by the current task, set by the
+# handlers, the tasks without them are background work
+current_priority: ContextVar[str] = ContextVar(
+    "current_priority", default="background"
+)
+current_user: ContextVar[int] = ContextVar("current_user", default=0)
+
+
+class Shed(FilmAffinityConnectionError):
+    """
+    The request waited too long for a slot and was dropped.
+    """
+
+
+class _Waiter:
+    __slots__ = ("future", "wakeup", "priority", "user", "since")
+
+    def __init__(self, priority: str, user: int):
+        loop = asyncio.get_event_loop()
+        # done when the slot is given
+        self.future = loop.create_future()
+        # done when promoted, the max wait changes with the priority
+        self.wakeup = loop.create_future()
+        self.priority = priority
+        self.user = user
+        self.since = time.monotonic()
+
+
+class UpstreamScheduler:
+    """
+    Bounds the requests to FilmAffinity running at once to `limit`.
+
+    The requests beyond it wait in a queue per priority, served from the
+    most urgent one and, inside a priority, in turns between the users, so
+    a user typing fast doesn't delay the others. A request waiting more
+    than the max wait of its priority raises Shed, a
+    FilmAffinityConnectionError, so the handlers answer with their error
+    message instead of letting the user wait for a timeout.
+    """
+
+    def __init__(
+        self,
+        limit: int = 16,
+        max_wait: Optional[Dict[str, float]] = None
+    ):
+        self.limit = limit
+        self.max_wait = dict(MAX_WAIT, **(max_wait or {}))
+        self.running = 0
+        self.queued = 0
+        self.granted = 0
+        self.waited = 0
+        self.shed = 0
+        # priority -> user -> waiters, the users in turn order
+        self._queues: Dict[str, "OrderedDict[int, Deque[_Waiter]]"] = {
+            priority: OrderedDict() for priority in PRIORITIES
+        }
+        # task -> its waiter, to promote the requests joined by others
+        self._waiters: Dict[asyncio.Task, _Waiter] = {}
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Waits for a slot for a request with the priority and user of the
+        current task.
+        """
+        priority = current_priority.get()
+        start = time.monotonic()
+        if self.running < self.limit and not self.queued:
+            self.running += 1
+        else:
+            await self._wait(priority)
+
+        self.granted += 1
+        METRICS.observe(
+            "upstream_wait_seconds", time.monotonic() - start,
+            priority=priority
+        )
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _wait(self, priority: str):
+        self.waited += 1
+        task = asyncio.current_task()
+        waiter = _Waiter(priority, current_user.get())
+        self._enqueue(waiter)
+        self._waiters[task] = waiter
+
+        try:
+            while not waiter.future.done():
+                max_wait = self.max_wait[waiter.priority]
+                remaining = waiter.since + max_wait - time.monotonic()
+                if remaining <= 0:
+                    self._dequeue(waiter)
+                    waiter.future.cancel()
+                    self.shed += 1
+                    METRICS.inc(
+                        "upstream_shed_total", priority=waiter.priority
+                    )
+                    raise Shed(
+                        f"Request to FilmAffinity waited more than {max_wait}s"
+                    )
+
+                await asyncio.wait(
+                    (waiter.future, waiter.wakeup),
+                    timeout=remaining,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if waiter.wakeup.done():
+                    waiter.wakeup = asyncio.get_event_loop().create_future()
+        except asyncio.CancelledError:
+            if waiter.future.done():
+                # the slot was given while being cancelled
+                self._release()
+            else:
+                self._dequeue(waiter)
+                waiter.future.cancel()
+            raise
+        finally:
+            del self._waiters[task]
+
+    def _enqueue(self, waiter: _Waiter):
+        users = self._queues[waiter.priority]
+        users.setdefault(waiter.user, deque()).append(waiter)
+        self.queued += 1
+
+    def _dequeue(self, waiter: _Waiter):
+        users = self._queues[waiter.priority]
+        waiters = users[waiter.user]
+        waiters.remove(waiter)
+        if not waiters:
+            del users[waiter.user]
+        self.queued -= 1
+
+    def _release(self):
+        for users in self._queues.values():
+            if not users:
+                continue
+
+            user, waiters = next(iter(users.items()))
+            waiter = waiters.popleft()
+            # the next request of this user waits for the other users
+            if waiters:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            self.queued -= 1
+            # the slot passes to the waiter, running stays the same
+            waiter.future.set_result(None)
+            return
+
+        self.running -= 1
+
+    def promote(self, task: asyncio.Task):
+        """
+        Moves the queued request of task to the priority of the current
+        task if more urgent, called when the current task joins its result.
+        """
+        waiter = self._waiters.get(task)
+        priority = current_priority.get()
+        # a waiter given its slot is already out of the queues
+        if waiter is None or waiter.future.done() or (
+            PRIORITIES.index(priority) >= PRIORITIES.index(waiter.priority)
+        ):
+            return
+
+        self._dequeue(waiter)
+        waiter.priority = priority
+        self._enqueue(waiter)
+        if not waiter.wakeup.done():
+            waiter.wakeup.set_result(None)
+
+    @property
+    def oldest_wait(self) -> float:
+        """
+        Seconds the oldest queued request has been waiting.
+        """
+        if not self._waiters:
+            return 0.0
+
+        return time.monotonic() - min(
+            waiter.since for waiter in self._waiters.values()
+        )
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the scheduler counters.
+        """
+        return (
+            f"{self.running}/{self.limit} running, {self.queued} queued, "
+            f"{self.granted} granted, {self.waited} waited, "
+            f"{self.shed} shed"
+        )
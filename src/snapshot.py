@@ -0,0 +1,200 @@
+from typing import Any, Dict, Optional
+from pathlib import Path
+import os
+import gzip
+import json
+import time
+import asyncio
+import logging
+import sqlite3
+
+import aiosqlite
+
+from caches import TTLCache
+from tops import TopLists
+
+
+# version of the format of the snapshot, others are ignored
+VERSION = 1
+
+
+def _key(key: Any) -> Any:
+    # the tuple keys are stored as JSON lists
+    return tuple(key) if isinstance(key, list) else key
+
+
+class Snapshot:
+    """
+    Compact snapshot of the hottest in-memory data: the most recently used
+    movies and search results and the tops.
+
+    Written as gzipped JSON every `interval` seconds and on stop, and loaded
+    on startup so a restarted bot doesn't send all its first requests to
+    FilmAffinity. The entries keep their remaining TTL and never replace
+    the ones cached since the startup.
+
+    The languages of the users are not in the snapshot, a snapshot older
+    than a change of language would restore the previous one, they are
+    loaded from the DB instead.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        movies: TTLCache,
+        searches: TTLCache,
+        langs: TTLCache,
+        tops: TopLists,
+        interval: float = 15 * 60,
+        max_movies: int = 1_000,
+        max_searches: int = 2_000
+    ):
+        self.path = path
+        self.movies = movies
+        self.searches = searches
+        self.langs = langs
+        self.tops = tops
+        self.interval = interval
+        self.max_movies = max_movies
+        self.max_searches = max_searches
+        self.saves = 0
+        self.errors = 0
+        self.size = 0
+        # entries restored by load()
+        self.restored: Dict[str, int] = {}
+        self.load_seconds: Optional[float] = None
+        self.age: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def _collect(self) -> Dict[str, Any]:
+        return {
+            "version": VERSION,
+            "saved": time.time(),
+            "movies": self.movies.dump(self.max_movies),
+            "searches": self.searches.dump(self.max_searches),
+            "tops": self.tops.dump(),
+        }
+
+    def _write(self, data: Dict[str, Any]) -> int:
+        content = gzip.compress(
+            json.dumps(data, separators=(",", ":")).encode("utf8")
+        )
+        # a crash while writing leaves the previous snapshot
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_bytes(content)
+        os.replace(tmp, self.path)
+
+        return len(content)
+
+    def _read(self) -> Dict[str, Any]:
+        return json.loads(gzip.decompress(self.path.read_bytes()))
+
+    async def save(self):
+        """
+        Writes the snapshot, the data is collected in the loop and
+        serialized in the default executor.
+        """
+        data = self._collect()
+        try:
+            self.size = await asyncio.get_event_loop().run_in_executor(
+                None, self._write, data
+            )
+            self.saves += 1
+        except (OSError, TypeError, ValueError) as e:
+            self.errors += 1
+            logging.error(f"Saving the snapshot failed: {e!r}")
+
+    async def load(self, db_conn: aiosqlite.Connection):
+        """
+        Restores the data of the last snapshot, if any, and the languages of
+        the users from the DB.
+        """
+        start = time.perf_counter()
+        await self._load_file()
+        self.restored["langs"] = await self._load_langs(db_conn)
+        self.load_seconds = time.perf_counter() - start
+
+        logging.info(
+            f"Snapshot loaded in {self.load_seconds:.2f}s: {self.restored}"
+        )
+
+    async def _load_file(self):
+        try:
+            data = await asyncio.get_event_loop().run_in_executor(
+                None, self._read
+            )
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError, EOFError) as e:
+            self.errors += 1
+            logging.error(f"Loading the snapshot failed: {e!r}")
+            return
+
+        if data.get("version") != VERSION:
+            return
+
+        self.age = age = max(0.0, time.time() - data["saved"])
+        for name, cache in (
+            ("movies", self.movies),
+            ("searches", self.searches),
+        ):
+            self.restored[name] = cache.load(
+                (_key(key), value, ttl - age if ttl is not None else None)
+                for key, value, ttl in data[name]
+            )
+        self.restored["tops"] = self.tops.load(data["tops"])
+
+    async def _load_langs(self, db_conn: aiosqlite.Connection) -> int:
+        try:
+            async with db_conn.execute(
+                "SELECT tid, lang FROM user LIMIT ?", (self.langs.maxsize, )
+            ) as cursor:
+                rows = await cursor.fetchall()
+        except sqlite3.Error as e:
+            self.errors += 1
+            logging.error(f"Loading the languages of the users failed: {e}")
+            return 0
+
+        # the languages changed since the startup are already cached
+        return self.langs.load(
+            (tid, lang, self.langs.ttl) for tid, lang in rows
+        )
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.save()
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Stops the periodic saves and writes a last snapshot.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+        await self.save()
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the snapshot state.
+        """
+        if self.load_seconds is None:
+            loaded = "nothing loaded"
+        else:
+            age = "-" if self.age is None else f"{self.age:.0f}s"
+            loaded = (
+                f"loaded {sum(self.restored.values())} entries "
+                f"({age} old) in {self.load_seconds:.2f}s"
+            )
+
+        return (
+            f"{loaded}, {self.saves} saves, "
+            f"{round(self.size / 1024, 1)} KB, {self.errors} errors"
+        )
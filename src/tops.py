@@ -0,0 +1,156 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import time
+import asyncio
+import logging
+
+from python_filmaffinity.exceptions import FilmAffinityConnectionError
+
+from bot_types import FAMovie
+from fa_async import AsyncFilmAffinity, TOP_SERVICES
+
+
+def render_top(service: str, result: List[FAMovie]) -> str:
+    """
+    Text of the message with the top of a service.
+    """
+    return f"🔝 Top {service} 🔝\n\n" + "\n\n".join(
+        [
+            "`%2d.` " % i + (
+                "[{title}](https://t.me/faffinitybot?start=id_{id})\n"
+                "📅 {year}      ⭐ {rating}/10"
+            ).format(**movie)
+            for movie, i in zip(result, range(1, 50))
+        ]
+    )
+
+
+class TopLists:
+    """
+    Rendered tops of all the services in all the languages.
+
+    The tops are refreshed in background every `interval` seconds, so the
+    users are answered from memory.
+    """
+
+    def __init__(
+        self,
+        clients: List[AsyncFilmAffinity],
+        interval: float,
+        size: int = 40
+    ):
+        self.clients = clients
+        self.interval = interval
+        self.size = size
+        self.refreshed_at: Optional[datetime] = None
+        self.refresh_duration = 0.0
+        self.refreshes = 0
+        self.errors = 0
+        # (lang, service) -> rendered text
+        self._texts: Dict[Tuple[str, str], str] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def _load(
+        self,
+        fa: AsyncFilmAffinity,
+        service: str,
+        allow_stale: bool = True
+    ) -> str:
+        text = render_top(
+            service, await fa.top(service, self.size, allow_stale)
+        )
+        self._texts[(fa.lang, service)] = text
+
+        return text
+
+    async def get(self, fa: AsyncFilmAffinity, service: str) -> str:
+        """
+        Rendered top of service, only loaded from FilmAffinity if the
+        background refresh didn't load it yet.
+        """
+        text = self._texts.get((fa.lang, service))
+        if text is None:
+            text = await self._load(fa, service)
+
+        return text
+
+    def dump(self) -> List[Tuple[str, str, str]]:
+        """
+        The rendered tops as (lang, service, text).
+        """
+        return [
+            (lang, service, text)
+            for (lang, service), text in self._texts.items()
+        ]
+
+    def load(self, tops: List[Tuple[str, str, str]]) -> int:
+        """
+        Restores tops made by dump() not loaded yet, returns the number
+        restored.
+        """
+        restored = 0
+        for lang, service, text in tops:
+            if (lang, service) not in self._texts:
+                self._texts[(lang, service)] = text
+                restored += 1
+
+        return restored
+
+    async def refresh(self):
+        """
+        Loads again all the tops, a failed top keeps its previous text.
+
+        The stale pages of the tops are revalidated before rendering them,
+        otherwise the tops would be always an interval old.
+        """
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            *(
+                self._load(fa, service, allow_stale=False)
+                for fa in self.clients
+                for service in TOP_SERVICES
+            ),
+            return_exceptions=True
+        )
+
+        for result in results:
+            if isinstance(result, FilmAffinityConnectionError):
+                self.errors += 1
+                logging.error(result)
+            elif isinstance(result, Exception):
+                self.errors += 1
+                logging.exception(result)
+
+        self.refreshes += 1
+        self.refreshed_at = datetime.now()
+        self.refresh_duration = time.perf_counter() - start
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stats(self) -> str:
+        """
+        Human readable summary of the tops state.
+        """
+        if self.refreshed_at is None:
+            return "not refreshed yet"
+
+        return (
+            f"{len(self._texts)} tops, refreshed at "
+            f"{self.refreshed_at.strftime('%Y-%m-%d %H:%M:%S')} "
+            f"in {self.refresh_duration:.1f}s, "
+            f"{self.refreshes} refreshes, {self.errors} errors"
+        )
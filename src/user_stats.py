@@ -0,0 +1,68 @@
+from typing import Dict, Optional
+
+import aiosqlite
+
+
+SCHEMA = """
+CREATE INDEX IF NOT EXISTS user_lang ON user (lang);
+CREATE TABLE IF NOT EXISTS user_count (
+    lang    VARCHAR(2)  PRIMARY KEY     NOT NULL,
+    users   INT64       DEFAULT 0       NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS user_count_insert AFTER INSERT ON user
+BEGIN
+    INSERT OR IGNORE INTO user_count (lang) VALUES (NEW.lang);
+    UPDATE user_count SET users = users + 1 WHERE lang = NEW.lang;
+END;
+CREATE TRIGGER IF NOT EXISTS user_count_update AFTER UPDATE OF lang ON user
+WHEN OLD.lang != NEW.lang
+BEGIN
+    UPDATE user_count SET users = users - 1 WHERE lang = OLD.lang;
+    INSERT OR IGNORE INTO user_count (lang) VALUES (NEW.lang);
+    UPDATE user_count SET users = users + 1 WHERE lang = NEW.lang;
+END;
+CREATE TRIGGER IF NOT EXISTS user_count_delete AFTER DELETE ON user
+BEGIN
+    UPDATE user_count SET users = users - 1 WHERE lang = OLD.lang;
+END;
+"""
+# counts the existing users when the counters are created
+POPULATE = """
+INSERT INTO user_count (lang, users) SELECT lang, COUNT() FROM user GROUP BY lang;
+"""
+
+
+class UserStats:
+    """
+    Number of users by language, kept in the user_count table by triggers
+    on the user table, so they are read without scanning the users.
+    """
+
+    def __init__(self):
+        self.db_conn: Optional[aiosqlite.Connection] = None
+
+    async def setup(self, db_conn: aiosqlite.Connection):
+        """
+        Creates the index, the counters and the triggers if missing, in a
+        single transaction with the initial count of the users.
+        """
+        self.db_conn = db_conn
+
+        async with db_conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+            "AND name = 'user_count'"
+        ) as cursor:
+            created = await cursor.fetchone() is not None
+
+        await db_conn.executescript(
+            "BEGIN;" + SCHEMA + ("" if created else POPULATE) + "COMMIT;"
+        )
+
+    async def counts(self) -> Dict[str, int]:
+        """
+        Returns lang -> number of users.
+        """
+        async with self.db_conn.execute(
+            "SELECT lang, users FROM user_count"
+        ) as cursor:
+            return {lang: users for lang, users in await cursor.fetchall()}
@@ -1,7 +1,10 @@
-from typing import List, Callable
+from typing import List, Callable, Optional, Tuple
 from logging import StreamHandler
+from collections import OrderedDict
+import time
 import asyncio
 import random
+import threading
 
 from telethon import TelegramClient
 from telethon.utils import split_text
@@ -9,25 +12,21 @@ from telethon.utils import split_text
 from bot_types import FAMovie
 
 
-def humanize(data: FAMovie):
+def humanize(data: FAMovie) -> FAMovie:
     """
-    Humanize the movie data, modifies the data inplace.
+    Humanized copy of the movie data, the data is not modified.
     """
-    for key in data:
-        if data[key]:
-            if isinstance(data[key], list):
-                if isinstance(data[key][0], (str, int,)):
-                    # avoid repeated values in list
-                    clean_list = []
-                    for entry in data[key]:
-                        if entry not in clean_list:
-                            clean_list.append(entry)
-
-                    data[key] = ", ".join(entry for entry in clean_list)
+    result = {}
+    for key, value in data.items():
+        if not value:
+            result[key] = "`-`"
+        elif isinstance(value, list) and isinstance(value[0], (str, int,)):
+            # avoid repeated values in list, keeping the order
+            result[key] = ", ".join(dict.fromkeys(value))
         else:
-            data[key] = "`-`"
+            result[key] = value
 
-    return data
+    return result
 
 
 def get_random_ad(_: Callable, ads: List[str]) -> str:
@@ -40,24 +39,115 @@ def get_random_ad(_: Callable, ads: List[str]) -> str:
 class TelegramLogsHandler(StreamHandler):
     """
     logging Handler to send logs to Telegram chat.
+
+    Records are buffered and sent in batches by a single background task,
+    started with start(). Repeated records in a batch are collapsed into a
+    count and the sends are rate limited. When the buffer is full new
+    records are dropped and the number of dropped records is reported.
     """
 
-    def __init__(self, client: TelegramClient, user_id: int):
+    def __init__(
+        self,
+        client: TelegramClient,
+        user_id: int,
+        flush_interval: float = 5,
+        send_interval: float = 1,
+        max_buffer: int = 200
+    ):
         StreamHandler.__init__(self)
         self.client = client
         self.user_id = user_id
+        self.flush_interval = flush_interval
+        self.send_interval = send_interval
+        self.max_buffer = max_buffer
+        self.sent = 0
+        self.dropped = 0
+        # (level, logger, message) -> [first record, times it was logged]
+        # since the last flush, the timestamps don't make records different
+        self._buffer: "OrderedDict[Tuple[str, str, str], list]" = OrderedDict()
+        self._dropped_since_flush = 0
+        self._last_send = 0.0
+        # records can be emitted from the executor threads
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
 
-    async def _emit(self, message):
+    def emit(self, record):
         try:
-            # Split the message in 4096 size chunks to fit Telegram messages size.
-            for chunk in [message[i:i+4096] for i in range(0, len(message), 4096)]:
+            key = (record.levelname, record.name, record.getMessage())
+        except Exception:
+            self.handleError(record)
+            return
+
+        with self._lock:
+            if key in self._buffer:
+                self._buffer[key][1] += 1
+            elif len(self._buffer) < self.max_buffer:
+                self._buffer[key] = [record, 1]
+            else:
+                self._dropped_since_flush += 1
+                self.dropped += 1
+
+    def _batch(self) -> List[str]:
+        """
+        Takes the buffered records, returns them as chunks that fit in
+        Telegram messages.
+        """
+        with self._lock:
+            entries = self._buffer.copy()
+            self._buffer.clear()
+            dropped = self._dropped_since_flush
+            self._dropped_since_flush = 0
+
+        # formatted with the time of the first of the repeated records
+        lines = [
+            f"`{self.format(record)}`" + (f" x{count}" if count > 1 else "")
+            for record, count in entries.values()
+        ]
+        if dropped:
+            lines.append(f"⚠ {dropped} log records dropped")
+
+        chunks = []
+        for line in lines:
+            # Split the lines in 4096 size chunks to fit Telegram messages size.
+            for part in [line[i:i+4096] for i in range(0, len(line), 4096)]:
+                if chunks and len(chunks[-1]) + len(part) < 4096:
+                    chunks[-1] += "\n" + part
+                else:
+                    chunks.append(part)
+
+        return chunks
+
+    async def flush_async(self):
+        for chunk in self._batch():
+            wait = self._last_send + self.send_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            self._last_send = time.monotonic()
+            try:
                 await self.client.send_message(self.user_id, chunk)
-        except ConnectionError:
-            pass
+                self.sent += 1
+            except Exception:
+                # logging it would feed this handler again
+                pass
 
-    def emit(self, record):
-        message = f"`{self.format(record)}`"
-        try:
-            asyncio.get_event_loop().create_task(self._emit(message))
-        except RuntimeError:
-            pass
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush_async()
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        """
+        Stops the background task sending the pending records.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+        await self.flush_async()